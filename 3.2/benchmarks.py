@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+# lambda_step2 builds its S3 client at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+MB = 1024 * 1024
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Streams a generated archive of the size in the path, e.g. /kline-64.zip is 64 MB"""
+    protocol_version = "HTTP/1.1"
+    block = os.urandom(64 * 1024)
+    delay = 0.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        size = int(self.path.rsplit('-', 1)[-1].split('.')[0]) * MB
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        sent = 0
+        while sent < size:
+            block = self.block[:size - sent]
+            self.wfile.write(block)
+            sent += len(block)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(handler=ArchiveHandler):
+    """Start a local stub server in a background thread and return it"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class CountingS3Stub:
+    """In-memory S3 stand-in that checks the multipart calls and only counts the bytes it receives"""
+
+    def __init__(self):
+        self.received = 0
+        self.parts = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self.lock:
+            self.received += len(Body)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {'UploadId': f"upload-{Key}"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.received += len(Body)
+            self.parts += 1
+        return {'ETag': f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        assert [part['PartNumber'] for part in MultipartUpload['Parts']] == list(range(1, len(MultipartUpload['Parts']) + 1))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        pass
+
+def buffered_upload(s3, url):
+    """The previous transfer: read the whole body, then one put_object"""
+    import requests
+
+    response = requests.get(url, stream=True, timeout=300)
+    response.raise_for_status()
+    s3.put_object(Bucket='stub', Key='stub', Body=response.content)
+    return len(response.content)
+
+def benchmark_stream(sizes=(16, 64, 256)):
+    """Report peak traced memory of buffered and streamed transfers for growing archive sizes"""
+    import lambda_step2
+
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    for size in sizes:
+        url = f"{base_url}/kline-{size}.zip"
+        for name in ('buffered', 'streamed'):
+            s3 = CountingS3Stub()
+            lambda_step2.s3_client = s3
+
+            tracemalloc.start()
+            start = time.time()
+            if name == 'buffered':
+                buffered_upload(s3, url)
+            else:
+                result = lambda_step2.download_and_upload_file(url)
+                assert result['success'], result
+            elapsed = time.time() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            assert s3.received == size * MB
+            print(f"{size} MB {name}: peak {peak / MB:.1f} MB, {s3.parts} parts, {elapsed:.2f}s")
+
+    server.shutdown()
+
+def benchmark_fanout(urls=16, size=4, delay=0.25):
+    """Report wall-clock time of one message with `urls` archives at 1, 4 and 16 concurrent transfers"""
+    import json
+    import lambda_step2
+
+    ArchiveHandler.delay = delay
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    event = {'Records': [{
+        'messageId': 'message-1',
+        'body': json.dumps([f"{base_url}/{n}/kline-{size}.zip" for n in range(urls)])
+    }]}
+
+    results = []
+    for concurrency in (1, 4, 16):
+        s3 = CountingS3Stub()
+        lambda_step2.s3_client = s3
+        lambda_step2.TRANSFER_CONCURRENCY = concurrency
+
+        start = time.time()
+        response = lambda_step2.lambda_handler(event, None)
+        elapsed = time.time() - start
+
+        body = json.loads(response['body'])
+        assert response['statusCode'] == 200 and body['total_processed'] == urls, body
+        results.append((concurrency, elapsed))
+
+    print()
+    for concurrency, elapsed in results:
+        print(f"{concurrency} concurrent transfers: {elapsed:.2f}s per message of {urls} x {size} MB")
+
+    server.shutdown()
+
+benchmarks = {
+    'stream': benchmark_stream,
+    'fanout': benchmark_fanout,
+}
+
+if __name__ == "__main__":
+    # Usage: python benchmarks.py <name>
+    name = sys.argv[1] if len(sys.argv) > 1 else 'stream'
+    benchmarks[name]()
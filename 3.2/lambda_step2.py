@@ -2,6 +2,8 @@ import json
 import boto3
 import requests
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from botocore.exceptions import ClientError
 
@@ -11,6 +13,12 @@ s3_client = boto3.client('s3')
 # S3 bucket name
 S3_BUCKET = 'binance-stockholm'
 
+# Multipart part size; every part but the last must be at least 5 MiB
+PART_SIZE = int(os.environ.get('PART_SIZE_MB', '8')) * 1024 * 1024
+
+# Number of URLs transferred at the same time within one invocation
+TRANSFER_CONCURRENCY = int(os.environ.get('TRANSFER_CONCURRENCY', '4'))
+
 def lambda_handler(event, context):
     """Lambda function to download files from URLs in SQS messages and save to S3"""
     print(f"Received event: {json.dumps(event, indent=2)}")
@@ -20,35 +28,49 @@ def lambda_handler(event, context):
         processed_files = []
         failed_files = []
 
-        for record in event['Records']:
-            try:
-                # Extract URLs from message body (it's a JSON string containing an array)
-                message_body = record['body']
-                urls = json.loads(message_body)
-
-                print(f"Processing {len(urls)} URLs from message: {record['messageId']}")
-
-                # Process each URL in the message
-                for url in urls:
-                    try:
-                        result = download_and_upload_file(url)
-                        if result['success']:
-                            processed_files.append(result)
-                            print(f"Successfully processed: {url}")
-                        else:
-                            failed_files.append({'url': url, 'error': result['error']})
-                            print(f"Failed to process: {url} - {result['error']}")
-
-                    except Exception as e:
-                        failed_files.append({'url': url, 'error': str(e)})
-                        print(f"Error processing URL {url}: {str(e)}")
-
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse message body as JSON: {message_body}")
-                failed_files.append({'message_id': record['messageId'], 'error': f"JSON decode error: {str(e)}"})
-            except Exception as e:
-                print(f"Error processing message {record['messageId']}: {str(e)}")
-                failed_files.append({'message_id': record['messageId'], 'error': str(e)})
+        # Every URL of every message goes to one bounded pool of transfers
+        with ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY) as executor:
+            transfers = []
+
+            for record in event['Records']:
+                try:
+                    # Extract URLs from message body (it's a JSON string containing an array)
+                    message_body = record['body']
+                    urls = json.loads(message_body)
+
+                    print(f"Processing {len(urls)} URLs from message: {record['messageId']}")
+
+                    started = time.time()
+                    for url in urls:
+                        transfers.append((record['messageId'], started, url, executor.submit(download_and_upload_file, url)))
+
+                except json.JSONDecodeError as e:
+                    print(f"Failed to parse message body as JSON: {message_body}")
+                    failed_files.append({'message_id': record['messageId'], 'error': f"JSON decode error: {str(e)}"})
+                except Exception as e:
+                    print(f"Error processing message {record['messageId']}: {str(e)}")
+                    failed_files.append({'message_id': record['messageId'], 'error': str(e)})
+
+            # Collect in submission order so results keep the order of the URLs
+            message_finished = {}
+            for message_id, started, url, future in transfers:
+                try:
+                    result = future.result()
+                    if result['success']:
+                        processed_files.append(result)
+                        print(f"Successfully processed: {url}")
+                    else:
+                        failed_files.append({'url': url, 'error': result['error']})
+                        print(f"Failed to process: {url} - {result['error']}")
+
+                except Exception as e:
+                    failed_files.append({'url': url, 'error': str(e)})
+                    print(f"Error processing URL {url}: {str(e)}")
+
+                message_finished[message_id] = (started, time.time())
+
+            for message_id, (started, finished) in message_finished.items():
+                print(f"Message {message_id} finished in {finished - started:.2f}s")
 
         # Return summary
         response_body = {
@@ -75,6 +97,73 @@ def lambda_handler(event, context):
             })
         }
 
+def stream_to_s3(response, bucket, key, metadata):
+    """
+    Upload a streamed HTTP response to S3, holding at most one part in memory.
+
+    Bodies smaller than one part go up with a single put_object, larger ones
+    as a multipart upload that is aborted if anything fails. Returns the size.
+    """
+    upload_id = None
+    parts = []
+    chunks = []
+    buffered = 0
+    file_size = 0
+
+    def upload_part():
+        part_number = len(parts) + 1
+        part = s3_client.upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=b''.join(chunks)
+        )
+        parts.append({'ETag': part['ETag'], 'PartNumber': part_number})
+
+    try:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            chunks.append(chunk)
+            buffered += len(chunk)
+            file_size += len(chunk)
+
+            if buffered >= PART_SIZE:
+                if upload_id is None:
+                    upload_id = s3_client.create_multipart_upload(
+                        Bucket=bucket,
+                        Key=key,
+                        ContentType='application/zip',
+                        Metadata=metadata
+                    )['UploadId']
+                upload_part()
+                chunks = []
+                buffered = 0
+
+        if upload_id is None:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=b''.join(chunks),
+                ContentType='application/zip',
+                Metadata=metadata
+            )
+            return file_size
+
+        if chunks:
+            upload_part()
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        return file_size
+
+    except Exception:
+        if upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
 def download_and_upload_file(url):
     """Download file from URL and upload to S3 bucket"""
     try:
@@ -94,24 +183,14 @@ def download_and_upload_file(url):
 
         print(f"Downloading {url} and uploading to s3://{S3_BUCKET}/{s3_key}")
 
-        # Download file with streaming to handle large files
-        response = requests.get(url, stream=True, timeout=300)  # 5 minute timeout
-        response.raise_for_status()
-
-        # Get file size for logging
-        file_size = len(response.content) if hasattr(response, 'content') else 'unknown'
+        # Download file with streaming and pipe it into S3 part by part
+        with requests.get(url, stream=True, timeout=300) as response:  # 5 minute timeout
+            response.raise_for_status()
 
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key,
-            Body=response.content,
-            ContentType='application/zip',
-            Metadata={
+            file_size = stream_to_s3(response, S3_BUCKET, s3_key, {
                 'source_url': url,
                 'original_filename': filename
-            }
-        )
+            })
 
         return {
             'success': True,
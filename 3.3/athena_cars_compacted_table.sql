@@ -0,0 +1,28 @@
+CREATE EXTERNAL TABLE IF NOT EXISTS cars_compacted (
+  ad_id BIGINT,
+  subject STRING,
+  price BIGINT,
+  list_time STRING,
+  share_url STRING,
+  seller_name STRING,
+  seller_type STRING,
+  brand STRING,
+  model STRING,
+  year INT,
+  mileage STRING,
+  fuel STRING,
+  gearbox STRING,
+  location STRING,
+  zipcode STRING
+)
+PARTITIONED BY (list_date STRING)
+STORED AS PARQUET
+LOCATION 's3://blocked-data-15/cars_parquet/'
+TBLPROPERTIES (
+  'parquet.compression'='SNAPPY',
+  'projection.enabled'='true',
+  'projection.list_date.type'='date',
+  'projection.list_date.format'='yyyy-MM-dd',
+  'projection.list_date.range'='1970-01-01,NOW',
+  'storage.location.template'='s3://blocked-data-15/cars_parquet/list_date=${list_date}/'
+);
\ No newline at end of file
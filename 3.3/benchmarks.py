@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a small search page after a fixed delay"""
+    protocol_version = "HTTP/1.1"
+    delay = 0.05
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({
+            'cars': [{'link': f"https://www.blocket.se/annons/{i}"} for i in range(40)]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ThrottlingStubHandler(StubHandler):
+    """StubHandler that answers 429 whenever more than `capacity` requests are in flight"""
+    capacity = 8
+    in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = ThrottlingStubHandler
+        with cls.lock:
+            cls.in_flight += 1
+            rejected = cls.in_flight > cls.capacity
+        try:
+            if rejected:
+                self.send_response(429)
+                self.send_header('Retry-After', '0.2')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                super().do_GET()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+def start_stub_server(handler=StubHandler):
+    """Start a local stub server in a background thread and return it"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def benchmark_step1(pages=400, concurrency=32):
+    """Compare pages per second for the process-pool and async step1 modes"""
+    server = start_stub_server()
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+
+    import step1
+    step1.base_url = f"http://127.0.0.1:{server.server_port}/search?page="
+    page_list = list(range(1, pages + 1))
+
+    max_workers = min(8, os.cpu_count())
+    start = time.time()
+    step1.download_all_processes(page_list, max_workers)
+    process_rate = pages / (time.time() - start)
+
+    start = time.time()
+    asyncio.run(step1.download_all_async(page_list, concurrency))
+    async_rate = pages / (time.time() - start)
+
+    server.shutdown()
+    print(f"\nprocess pool ({max_workers} workers): {process_rate:.1f} pages/s")
+    print(f"async ({concurrency} concurrent): {async_rate:.1f} pages/s")
+
+async def fetch_goodput(url, requests_total, concurrency, adaptive):
+    """Fire `requests_total` GETs and return (successes, elapsed seconds)"""
+    import aiohttp
+    from blocket_throttle import AsyncAdaptiveLimiter, get_with_retry_async
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = AsyncAdaptiveLimiter(initial=4, maximum=concurrency)
+
+    async def fetch(session):
+        if adaptive:
+            status, _ = await get_with_retry_async(session, url, limiter)
+            return status == 200
+        # Same retries, but every worker keeps its slot while it backs off
+        async with semaphore:
+            status, _ = await get_with_retry_async(session, url)
+            return status == 200
+
+    start = time.time()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        results = await asyncio.gather(*(fetch(session) for _ in range(requests_total)))
+    return sum(results), time.time() - start
+
+def benchmark_throttle(requests_total=400, concurrency=32):
+    """Compare goodput of a fixed worker count and the adaptive limiter against a 429-injecting server"""
+    server = start_stub_server(ThrottlingStubHandler)
+    url = f"http://127.0.0.1:{server.server_port}/search"
+
+    for adaptive in (False, True):
+        ok, elapsed = asyncio.run(fetch_goodput(url, requests_total, concurrency, adaptive))
+        label = "adaptive limiter" if adaptive else f"fixed {concurrency} workers"
+        print(f"{label}: {ok}/{requests_total} succeeded, goodput {ok / elapsed:.1f} responses/s")
+
+    server.shutdown()
+
+def generate_page_corpus(folder, files=10000, cars_per_page=40):
+    """Write a synthetic step1 corpus of search pages, half of the links repeated across sort orders"""
+    os.makedirs(folder, exist_ok=True)
+    sorts = ['cheapest', 'expensive', 'latest', 'oldest']
+    for n in range(files):
+        sort = sorts[n % len(sorts)]
+        page = n // len(sorts) + 1
+        cars = [{
+            'dealId': str(page * 100 + i),
+            'link': f"https://www.blocket.se/annons/{(page * 100 + i) if i % 2 else n * 100 + i}",
+            'heading': f"Car {i}",
+            'price': {'amount': f"{100000 + i} kr"},
+            'images': [{'url': f"https://images.blocket.se/{n}/{i}/{k}.jpg"} for k in range(5)],
+        } for i in range(cars_per_page)]
+        with open(os.path.join(folder, f"page_{page}_{sort}.json"), 'w', encoding='utf-8') as f:
+            json.dump({'cars': cars, 'pagination': {'page': page}}, f, indent=2)
+
+def benchmark_step2(files=10000):
+    """Compare serial json.load extraction with the parallel, deduplicating step2 on a generated corpus"""
+    import step2
+
+    workdir = tempfile.mkdtemp()
+    step1_folder = os.path.join(workdir, 'step1')
+    generate_page_corpus(step1_folder, files)
+
+    start = time.time()
+    links = []
+    for json_file in os.listdir(step1_folder):
+        with open(os.path.join(step1_folder, json_file), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        links.extend(car['link'] for car in data['cars'] if car.get('link'))
+    baseline = time.time() - start
+
+    start = time.time()
+    unique_links = step2.extract_car_links(step1_folder)
+    step2.create_csv_files(unique_links, step2_folder=os.path.join(workdir, 'step2'))
+    engine = time.time() - start
+
+    print(f"\njson.load per file: {len(links)} links in {baseline:.2f}s ({files / baseline:.0f} files/s)")
+    print(f"step2 engine: {len(unique_links)} unique links in {engine:.2f}s ({files / engine:.0f} files/s, incl. CSV writing)")
+
+def generate_detail_corpus(folder, files=20000):
+    """Write a synthetic step3 corpus of ad detail files"""
+    os.makedirs(folder, exist_ok=True)
+    for n in range(files):
+        data = {'data': {
+            'ad_id': str(1000000 + n),
+            'subject': f"Volvo V60 D4 {n}",
+            'price': {'value': 150000 + n},
+            'parameter_groups': [{'parameters': [
+                {'id': 'fuel', 'value': 'Diesel'},
+                {'id': 'gearbox', 'value': 'Automat'},
+                {'id': 'mileage', 'value': f"{n % 30000} 000"},
+                {'id': 'regdate', 'value': str(2000 + n % 25)},
+                {'id': 'cx_make', 'value': 'Volvo'},
+                {'id': 'cx_model', 'value': 'V60'},
+                {'id': 'cx_engine_power', 'value': '190 Hk'},
+            ]}],
+            'attributes': [{'id': 'car_equipment', 'items': [{'name': f"item {k}"} for k in range(20)]}],
+            'advertiser': {'type': 'private', 'name': 'Seller'},
+            'location': [{'name': 'Stockholm'}, {'name': 'Solna'}],
+        }}
+        with open(os.path.join(folder, f"{1000000 + n}.json"), 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+def benchmark_step4(files=20000, chunk_sizes=(1, 10, 100, 1000)):
+    """Report step4 files per second at several chunk sizes"""
+    import step4
+
+    workdir = tempfile.mkdtemp()
+    step3_folder = os.path.join(workdir, 'step3')
+    generate_detail_corpus(step3_folder, files)
+    max_workers = min(8, os.cpu_count())
+
+    results = []
+    for chunk_size in chunk_sizes:
+        start = time.time()
+        step4.process_json_files(step3_folder, os.path.join(workdir, 'out.parquet'), max_workers, 'parquet', chunk_size)
+        results.append((chunk_size, files / (time.time() - start)))
+
+    print()
+    for chunk_size, rate in results:
+        print(f"chunk size {chunk_size}: {rate:.0f} files/s")
+
+class FlakySqsStub:
+    """In-memory SQS stand-in: fixed latency per call, a share of entries fails transiently"""
+
+    def __init__(self, latency=0.02, failure_rate=0.2):
+        import random
+        self.random = random.Random(42)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        time.sleep(self.latency)
+        successful = []
+        failed = []
+        with self.lock:
+            self.calls += 1
+            for entry in Entries:
+                if self.random.random() < self.failure_rate:
+                    failed.append({'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError'})
+                else:
+                    successful.append({'Id': entry['Id']})
+                    self.received.append(entry['MessageBody'])
+        return {'Successful': successful, 'Failed': failed}
+
+def benchmark_sqs(messages=4000):
+    """Compare one-at-a-time and concurrent SendMessageBatch against a stub that fails 20% of entries"""
+    from sqs_producer import send_messages
+
+    bodies = [json.dumps({'link': f"https://www.blocket.se/annons/{i}"}) for i in range(messages)]
+    for max_workers in (1, 8, 32):
+        stub = FlakySqsStub()
+        result = send_messages(stub, 'stub-queue', bodies, max_workers=max_workers)
+        duplicates = len(stub.received) - len(set(stub.received))
+        print(f"{max_workers} senders: {result['sent']}/{messages} delivered, {result['failed']} failed, "
+              f"{duplicates} duplicates, {stub.calls} calls, {result['messages_per_second']:.0f} msg/s")
+
+benchmarks = {
+    'step1': benchmark_step1,
+    'throttle': benchmark_throttle,
+    'step2': benchmark_step2,
+    'step4': benchmark_step4,
+    'sqs': benchmark_sqs,
+}
+
+if __name__ == "__main__":
+    # Usage: python benchmarks.py <name>
+    name = sys.argv[1] if len(sys.argv) > 1 else 'step1'
+    benchmarks[name]()
@@ -0,0 +1,168 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+# Responses that mean "slow down and try again"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter shared by every Blocket fetcher.
+
+    The limit grows by one slot per window of successful requests while all
+    slots are in use, and is halved on a 429/5xx, so the fetchers settle at
+    the highest concurrency the API tolerates instead of a fixed worker count.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=64, rate_window=10.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.rate_window = rate_window
+        self._completions = deque()
+        self._started = 0
+        self._decreased_at = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Block until a request slot is free and return the request's ticket for release()"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self._started += 1
+            return self._started
+
+    def release(self, ticket, throttled=None):
+        """
+        Free a request slot and adjust the limit from its outcome: True for a
+        429/5xx, False for a success, None when it never got a response
+        """
+        with self._condition:
+            self._record(ticket, throttled)
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _record(self, ticket, throttled):
+        now = time.monotonic()
+        # Requests started before the last decrease ran at the old limit, so
+        # their outcome says nothing about the current one
+        current = ticket > self._decreased_at
+        if throttled:
+            if current:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._decreased_at = self._started
+        elif throttled is False:
+            # Only a limit that is actually used has earned another slot
+            if current and self.in_flight >= int(self.limit):
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._completions.append(now)
+
+        while self._completions and now - self._completions[0] > self.rate_window:
+            self._completions.popleft()
+
+    def rate(self):
+        """Successful requests per second over the last rate window"""
+        now = time.monotonic()
+        recent = [t for t in list(self._completions) if now - t <= self.rate_window]
+        return len(recent) / self.rate_window
+
+class AsyncAdaptiveLimiter(AdaptiveLimiter):
+    """AdaptiveLimiter for coroutines running on a single event loop"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._async_condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._async_condition:
+            while self.in_flight >= int(self.limit):
+                await self._async_condition.wait()
+            self.in_flight += 1
+            self._started += 1
+            return self._started
+
+    async def release(self, ticket, throttled=None):
+        async with self._async_condition:
+            self._record(ticket, throttled)
+            self.in_flight -= 1
+            self._async_condition.notify_all()
+
+def retry_delay(attempt, retry_after=None, base=0.5, cap=30.0):
+    """
+    Seconds to wait before retry number `attempt`.
+
+    Honors a Retry-After header (seconds or HTTP date) when the server sent
+    one, otherwise uses full-jitter exponential backoff.
+    """
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(cap, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def get_with_retry(session, url, limiter=None, max_retries=5, **kwargs):
+    """
+    GET `url` through a requests session, retrying 429/5xx and connection errors.
+
+    Returns the final response, which may still carry an error status once
+    the retries run out. Re-raises the last exception if every attempt failed
+    to connect.
+    """
+    for attempt in range(max_retries + 1):
+        ticket = limiter.acquire() if limiter else None
+        throttled = None
+        retry_after = None
+        try:
+            response = session.get(url, **kwargs)
+            throttled = response.status_code in RETRY_STATUSES
+            retry_after = response.headers.get('Retry-After')
+        except Exception:
+            # A connection error says nothing about the server's capacity
+            if attempt == max_retries:
+                raise
+        finally:
+            if limiter:
+                limiter.release(ticket, throttled)
+
+        if throttled is False or attempt == max_retries:
+            return response
+        # Back off only once the slot is released, after a connection error too
+        time.sleep(retry_delay(attempt, retry_after))
+
+async def get_with_retry_async(session, url, limiter=None, max_retries=5, **kwargs):
+    """
+    Async counterpart of get_with_retry for aiohttp sessions.
+
+    Returns (status, body bytes) of the final attempt.
+    """
+    for attempt in range(max_retries + 1):
+        ticket = await limiter.acquire() if limiter else None
+        throttled = None
+        retry_after = None
+        try:
+            async with session.get(url, **kwargs) as response:
+                status = response.status
+                retry_after = response.headers.get('Retry-After')
+                body = await response.read()
+            throttled = status in RETRY_STATUSES
+        except Exception:
+            # A connection error says nothing about the server's capacity
+            if attempt == max_retries:
+                raise
+        finally:
+            if limiter:
+                await limiter.release(ticket, throttled)
+
+        if throttled is False or attempt == max_retries:
+            return status, body
+        # Back off only once the slot is released, after a connection error too
+        await asyncio.sleep(retry_delay(attempt, retry_after))
@@ -0,0 +1,64 @@
+def strip_spaces(value):
+    """'12 345' -> '12345'"""
+    return value.replace(' ', '') if isinstance(value, str) else value
+
+def compile_fields(spec):
+    """
+    Compile a list of (parameter id, output column, normalizer) entries into
+    a dispatch table keyed by parameter id.
+
+    When several parameter ids feed the same column, the earlier entry wins
+    and later ones only fill the column while it is still empty.
+    """
+    dispatch = {}
+    for priority, (param_id, column, normalizer) in enumerate(spec):
+        dispatch[param_id] = (column, normalizer, priority)
+    return dispatch
+
+def extract_parameters(car_data, dispatch):
+    """Walk parameter_groups[].parameters[] once and return {column: value}"""
+    values = {}
+    priorities = {}
+    for group in car_data.get('parameter_groups', []):
+        for param in group.get('parameters', []):
+            entry = dispatch.get(param.get('id'))
+            if entry is None:
+                continue
+            column, normalizer, priority = entry
+            value = param.get('value', '')
+            # An empty value never blocks a lower-priority entry from filling the column
+            if not value and column in values:
+                continue
+            if column in priorities and priority > priorities[column] and values[column]:
+                continue
+            values[column] = normalizer(value) if normalizer else value
+            priorities[column] = priority
+    return values
+
+# Columns of car_features_short.csv produced by step4.py
+FEATURE_FIELDS = compile_fields([
+    ('fuel', 'fuel', None),
+    ('gearbox', 'gearbox', None),
+    ('mileage', 'mileage', strip_spaces),
+    ('regdate', 'model_year', None),
+    ('cx_make', 'brand', None),
+    ('cx_engine_power', 'horsepower', None),
+    ('cx_model', 'model', None),
+    ('cx_color', 'color', None),
+    ('cx_first_time_in_traffic', 'first_traffic_date', None),
+    ('cx_drive_wheels', 'drive_wheels', None),
+    ('car_chassis_type', 'body_type', None),
+    ('level_1', 'model_family', None),
+])
+
+# Columns of the flat/ rows produced by lambda_step4.py
+FLAT_FIELDS = compile_fields([
+    ('car_brand', 'brand', None),
+    ('cx_make', 'brand', None),
+    ('level_1', 'model', None),
+    ('cx_model', 'model', None),
+    ('regdate', 'year', None),
+    ('mileage', 'mileage', None),
+    ('fuel', 'fuel', None),
+    ('gearbox', 'gearbox', None),
+])
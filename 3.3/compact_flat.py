@@ -0,0 +1,268 @@
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+# Same columns and types as the `cars` table in athena_cars_table.sql
+CARS_SCHEMA = pa.schema([
+    ('ad_id', pa.int64()),
+    ('subject', pa.string()),
+    ('price', pa.int64()),
+    ('list_time', pa.string()),
+    ('share_url', pa.string()),
+    ('seller_name', pa.string()),
+    ('seller_type', pa.string()),
+    ('brand', pa.string()),
+    ('model', pa.string()),
+    ('year', pa.int32()),
+    ('mileage', pa.string()),
+    ('fuel', pa.string()),
+    ('gearbox', pa.string()),
+    ('location', pa.string()),
+    ('zipcode', pa.string()),
+])
+
+# Rows without a list_time land in this partition so date projection still works
+UNKNOWN_DATE = '1970-01-01'
+
+# lambda_step4 names its objects batch_<%Y%m%d_%H%M%S>_<request id>.csv.gz when it
+# writes them; listing starts this long before the watermark to cover the upload
+LISTING_MARGIN = timedelta(minutes=15)
+
+s3 = boto3.client('s3')
+
+def load_state(bucket, key):
+    """Load the compaction state: LastModified watermark and ad_id -> [partition, list_time] index"""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        return json.loads(response['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return {'watermark': '', 'ad_partitions': {}}
+        raise
+
+def save_state(bucket, key, state):
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(state), ContentType='application/json')
+
+def list_objects(bucket, prefix, start_after=None):
+    """Yield every object under the prefix, only keys after `start_after` if given"""
+    paginator = s3.get_paginator('list_objects_v2')
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    for page in paginator.paginate(**params):
+        for obj in page.get('Contents', []):
+            yield obj
+
+def prefix_stats(bucket, prefix):
+    """Object count and total bytes under a prefix, i.e. what a full Athena scan reads"""
+    count = 0
+    size = 0
+    for obj in list_objects(bucket, prefix):
+        # Athena skips files starting with '_', like the compaction state
+        if os.path.basename(obj['Key']).startswith('_'):
+            continue
+        count += 1
+        size += obj['Size']
+    return count, size
+
+def to_int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+def read_flat_rows(bucket, key):
+    """Read the rows of one flat/ CSV object, gzip-compressed or not"""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    if key.endswith('.gz'):
+        body = gzip.decompress(body)
+
+    rows = []
+    for row in csv.DictReader(io.StringIO(body.decode('utf-8'))):
+        typed = {}
+        for field in CARS_SCHEMA:
+            value = row.get(field.name)
+            if pa.types.is_integer(field.type):
+                value = to_int(value)
+            elif value == '':
+                value = None
+            typed[field.name] = value
+        if typed['ad_id'] is not None:
+            rows.append(typed)
+    return rows
+
+def partition_of(row):
+    list_time = row.get('list_time') or ''
+    return list_time[:10] if len(list_time) >= 10 else UNKNOWN_DATE
+
+def partition_key(prefix, date):
+    return f"{prefix}list_date={date}/data.parquet"
+
+def read_partition(bucket, prefix, date):
+    """Read an existing partition file as {ad_id: row}, empty if it does not exist yet"""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=partition_key(prefix, date))['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return {}
+        raise
+    return {row['ad_id']: row for row in pq.read_table(io.BytesIO(body)).to_pylist()}
+
+def write_partition(bucket, prefix, date, rows):
+    key = partition_key(prefix, date)
+    if not rows:
+        s3.delete_object(Bucket=bucket, Key=key)
+        return
+    buffer = io.BytesIO()
+    table = pa.Table.from_pylist(sorted(rows, key=lambda row: row['ad_id']), schema=CARS_SCHEMA)
+    pq.write_table(table, buffer, compression='snappy')
+    s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+
+def listing_start(source_prefix, watermark):
+    """First key that can hold rows written after the watermark, None on the first run"""
+    if not watermark:
+        return None
+    start = datetime.fromisoformat(watermark) - LISTING_MARGIN
+    return f"{source_prefix}batch_{start.strftime('%Y%m%d_%H%M%S')}"
+
+def previous_location(ad_partitions, ad_id, partitions, bucket, prefix):
+    """
+    Partition and list_time an ad was last written with, or None for a new ad.
+    Older states only stored the partition; its list_time is read from that file.
+    """
+    previous = ad_partitions.get(str(ad_id))
+    if previous is None:
+        return None
+    if isinstance(previous, list):
+        return previous
+    if previous not in partitions:
+        partitions[previous] = read_partition(bucket, prefix, previous)
+    row = partitions[previous].get(ad_id)
+    return [previous, (row['list_time'] or '') if row else '']
+
+def compact(bucket, source_prefix='flat/', target_prefix='cars_parquet/', delete_source=False, max_workers=16):
+    """
+    Merge the flat/ objects written since the last run into date-partitioned
+    Parquet files, keeping only the newest list_time per ad_id.
+    """
+    state_key = f"{target_prefix}_compaction_state.json"
+    state = load_state(bucket, state_key)
+    ad_partitions = state['ad_partitions']
+
+    # Keys are time-ordered, so only the tail of the prefix is listed. Objects
+    # from the watermark second itself are read again; the merge is idempotent.
+    start_after = listing_start(source_prefix, state['watermark'])
+    new_objects = [obj for obj in list_objects(bucket, source_prefix, start_after)
+                   if obj['LastModified'].isoformat() >= state['watermark']]
+    print(f"Found {len(new_objects)} new objects in s3://{bucket}/{source_prefix}")
+    if not new_objects:
+        return 0
+
+    # Newest row per ad among the new objects
+    latest = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for rows in executor.map(lambda obj: read_flat_rows(bucket, obj['Key']), new_objects):
+            for row in rows:
+                current = latest.get(row['ad_id'])
+                if current is None or (row['list_time'] or '') >= (current['list_time'] or ''):
+                    latest[row['ad_id']] = row
+
+    # Partitions read so far, by date
+    partitions = {}
+
+    # Group changes by partition, including partitions an ad moves out of.
+    # A row older than the one already compacted changes nothing.
+    touched = {}
+    for ad_id, row in list(latest.items()):
+        previous = previous_location(ad_partitions, ad_id, partitions, bucket, target_prefix)
+        if previous and (row['list_time'] or '') < previous[1]:
+            del latest[ad_id]
+            continue
+        touched.setdefault(partition_of(row), {})[ad_id] = row
+        if previous and previous[0] != partition_of(row):
+            touched.setdefault(previous[0], {})
+
+    for date, incoming in touched.items():
+        existing = partitions.get(date)
+        if existing is None:
+            existing = read_partition(bucket, target_prefix, date)
+        for ad_id, row in incoming.items():
+            current = existing.get(ad_id)
+            if current is None or (row['list_time'] or '') >= (current['list_time'] or ''):
+                existing[ad_id] = row
+        # Drop ads whose newest row now lives in another partition
+        merged = [row for ad_id, row in existing.items()
+                  if partition_of(latest.get(ad_id, row)) == date]
+        for row in merged:
+            ad_partitions[str(row['ad_id'])] = [date, row['list_time'] or '']
+        write_partition(bucket, target_prefix, date, merged)
+        print(f"Wrote partition list_date={date} with {len(merged)} ads")
+
+    state['watermark'] = max(obj['LastModified'] for obj in new_objects).isoformat()
+    save_state(bucket, state_key, state)
+
+    if delete_source:
+        keys = [obj['Key'] for obj in new_objects]
+        for i in range(0, len(keys), 1000):
+            s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]]})
+        print(f"Deleted {len(keys)} compacted source objects")
+
+    return len(latest)
+
+def partitioned_table_ddl(bucket, target_prefix='cars_parquet/', table='cars_compacted'):
+    """Athena DDL for the compacted table, using partition projection on list_date"""
+    columns = ',\n'.join(
+        f"  {field.name} {'BIGINT' if field.type == pa.int64() else 'INT' if field.type == pa.int32() else 'STRING'}"
+        for field in CARS_SCHEMA
+    )
+    location = f"s3://{bucket}/{target_prefix}"
+    return f"""CREATE EXTERNAL TABLE IF NOT EXISTS {table} (
+{columns}
+)
+PARTITIONED BY (list_date STRING)
+STORED AS PARQUET
+LOCATION '{location}'
+TBLPROPERTIES (
+  'parquet.compression'='SNAPPY',
+  'projection.enabled'='true',
+  'projection.list_date.type'='date',
+  'projection.list_date.format'='yyyy-MM-dd',
+  'projection.list_date.range'='{UNKNOWN_DATE},NOW',
+  'storage.location.template'='{location}list_date=${{list_date}}/'
+);"""
+
+def main():
+    bucket = os.environ.get('S3_BUCKET_NAME', 'blocked-data-15')
+    source_prefix = os.environ.get('S3_PREFIX', 'flat/')
+    target_prefix = os.environ.get('TARGET_PREFIX', 'cars_parquet/')
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'ddl':
+        print(partitioned_table_ddl(bucket, target_prefix))
+        return
+
+    delete_source = len(sys.argv) > 1 and sys.argv[1] == '--delete-source'
+
+    before_count, before_bytes = prefix_stats(bucket, source_prefix)
+    compacted_before, _ = prefix_stats(bucket, target_prefix)
+
+    ads = compact(bucket, source_prefix, target_prefix, delete_source)
+
+    after_count, after_bytes = prefix_stats(bucket, target_prefix)
+    print(f"\nMerged {ads} ads")
+    print(f"Before: {before_count} objects, {before_bytes} bytes scanned by a full query on {source_prefix}")
+    print(f"After: {after_count} objects, {after_bytes} bytes scanned by a full query on {target_prefix} "
+          f"({compacted_before} objects before this run)")
+
+if __name__ == "__main__":
+    # Usage: python compact_flat.py [--delete-source | ddl]
+    main()
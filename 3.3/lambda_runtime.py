@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Module scope runs once per execution environment, i.e. on a cold start
+INIT_STARTED = time.time()
+
+# Size of every connection pool below; at least the number of threads a handler runs
+POOL_CONNECTIONS = int(os.environ.get('POOL_CONNECTIONS', '50'))
+
+# CloudWatch namespace of the timing metric
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'BlocketPipeline')
+
+client_config = Config(max_pool_connections=POOL_CONNECTIONS)
+s3 = boto3.client('s3', config=client_config)
+sqs = boto3.client('sqs', config=client_config)
+lambda_client = boto3.client('lambda')
+
+# Keep-alive HTTP session shared by every handler thread, see get_session()
+session = None
+session_lock = threading.Lock()
+
+INIT_SECONDS = time.time() - INIT_STARTED
+
+warm = False
+
+def get_session():
+    """
+    Return the shared requests session, created on first use.
+
+    requests is imported here, so handlers that only use boto3 (lambda_step1,
+    lambda_step3) do not need it in their deployment package.
+    """
+    global session
+    with session_lock:
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=POOL_CONNECTIONS)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+    return session
+
+def begin_invocation():
+    """
+    Mark the start of a handler invocation.
+
+    The first invocation in an execution environment is the cold start.
+    """
+    global warm
+    invocation = {'started': time.time(), 'cold_start': not warm}
+    warm = True
+    return invocation
+
+def emit_timing(function_name, invocation, records):
+    """
+    Log duration and per-record latency as a CloudWatch embedded metric,
+    split by cold and warm start, and return the values
+    """
+    duration_ms = (time.time() - invocation['started']) * 1000
+    timing = {
+        'Function': function_name,
+        'StartType': 'cold' if invocation['cold_start'] else 'warm',
+        'Duration': round(duration_ms, 1),
+        'Records': records,
+        'PerRecordLatency': round(duration_ms / records, 1) if records else 0.0,
+        'InitDuration': round(INIT_SECONDS * 1000, 1) if invocation['cold_start'] else 0.0
+    }
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Function', 'StartType']],
+                'Metrics': [
+                    {'Name': 'Duration', 'Unit': 'Milliseconds'},
+                    {'Name': 'Records', 'Unit': 'Count'},
+                    {'Name': 'PerRecordLatency', 'Unit': 'Milliseconds'},
+                    {'Name': 'InitDuration', 'Unit': 'Milliseconds'}
+                ]
+            }]
+        },
+        **timing
+    }))
+    return timing
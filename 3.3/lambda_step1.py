@@ -1,12 +1,20 @@
 import json
-import boto3
 import os
-from botocore.exceptions import ClientError
+
+from sqs_producer import send_messages
+from lambda_runtime import sqs, begin_invocation, emit_timing
+
+# Number of SendMessageBatch calls kept in flight
+SEND_CONCURRENCY = int(os.environ.get('SEND_CONCURRENCY', '8'))
+
+# Number of page numbers carried by one SQS message
+PACK_SIZE = int(os.environ.get('PACK_SIZE', '10'))
 
 def lambda_handler(event, context):
     """
     AWS Lambda function to send car search URLs (page 1-400) to SQS queue
     """
+    invocation = begin_invocation()
 
     # SQS queue URL - should be set as environment variable
     queue_url = os.environ.get('SQS_QUEUE_URL')
@@ -19,56 +27,38 @@ def lambda_handler(event, context):
             })
         }
 
-    # Initialize SQS client
-    sqs = boto3.client('sqs')
-
     # Base URL
     base_url = "https://api.blocket.se/motor-search-service/v4/search/car?sortOrder=H%C3%B6gst+miltal&page="
 
     sent_messages = 0
     failed_messages = 0
+    sent_pages = 0
+    messages_per_second = 0.0
 
     try:
-        # Send messages in batches of 10 to optimize SQS operations
-        batch_size = 10
-        for page_start in range(1, 401, batch_size):
-            entries = []
-
-            for page in range(page_start, min(page_start + batch_size, 401)):
-                # Construct the full URL
-                url = f"{base_url}{page}"
-
-                # Create message entry for batch
-                entries.append({
-                    'Id': str(page),
-                    'MessageBody': json.dumps({
-                        'page': page,
-                        'url': url,
-                        'timestamp': context.aws_request_id if context else None
-                    })
-                })
-
-            # Send batch to SQS
-            if entries:
-                try:
-                    response = sqs.send_message_batch(
-                        QueueUrl=queue_url,
-                        Entries=entries
-                    )
-
-                    # Check for failed messages in batch
-                    if 'Failed' in response and response['Failed']:
-                        failed_messages += len(response['Failed'])
-                        print(f"Failed to send {len(response['Failed'])} messages in batch starting at page {page_start}")
-
-                    successful_in_batch = len(entries) - (len(response.get('Failed', [])))
-                    sent_messages += successful_in_batch
+        # Each message carries PACK_SIZE page numbers under one base URL; the
+        # producer packs the messages into batches of 10, sends the batches
+        # concurrently and retries failed entries
+        pages = list(range(1, 401))
+        packs = [pages[i:i + PACK_SIZE] for i in range(0, len(pages), PACK_SIZE)]
+        bodies = [
+            json.dumps({
+                'url': base_url,
+                'pages': pack,
+                'timestamp': context.aws_request_id if context else None
+            })
+            for pack in packs
+        ]
 
-                    print(f"Sent batch: pages {page_start}-{min(page_start + batch_size - 1, 400)} ({successful_in_batch} messages)")
+        result = send_messages(sqs, queue_url, bodies, max_workers=SEND_CONCURRENCY)
+        sent_messages = result['sent']
+        failed_messages = result['failed']
+        messages_per_second = result['messages_per_second']
+        sent_pages = sum(len(packs[index]) for index in result['successful_indexes'])
 
-                except ClientError as e:
-                    print(f"Error sending batch starting at page {page_start}: {str(e)}")
-                    failed_messages += len(entries)
+        if result['failed_indexes']:
+            failed_pages = sorted(page for index in result['failed_indexes'] for page in packs[index])
+            print(f"Failed to send pages: {failed_pages}")
 
     except Exception as e:
         return {
@@ -80,14 +70,18 @@ def lambda_handler(event, context):
             })
         }
 
+    emit_timing('lambda_step1', invocation, sent_pages)
+
     # Return success response
     return {
         'statusCode': 200,
         'body': json.dumps({
-            'message': f'Successfully sent {sent_messages} URLs to SQS queue',
+            'message': f'Successfully sent {sent_pages} pages in {sent_messages} messages to SQS queue',
             'total_pages': 400,
+            'sent_pages': sent_pages,
             'sent_messages': sent_messages,
             'failed_messages': failed_messages,
-            'success_rate': f"{(sent_messages/400)*100:.1f}%" if sent_messages > 0 else "0%"
+            'messages_per_second': round(messages_per_second, 1),
+            'success_rate': f"{(sent_pages/400)*100:.1f}%" if sent_pages > 0 else "0%"
         })
     }
@@ -1,13 +1,24 @@
 import json
-import boto3
+import gzip
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from botocore.exceptions import ClientError
 from urllib.parse import urlparse, parse_qs
 
+from blocket_throttle import AdaptiveLimiter, get_with_retry
+from lambda_runtime import get_session, s3 as s3_client, begin_invocation, emit_timing
+
+# Reused across warm invocations so the limit keeps what it learned
+limiter = AdaptiveLimiter(initial=4, maximum=16)
+
+# 'gzip' stores the response bytes as received, gzip-compressed;
+# 'json' re-serializes them indented and uncompressed
+STORAGE_MODE = os.environ.get('STORAGE_MODE', 'gzip')
+
 def download_car_data(url, headers=None):
     """
-    Download car data from the given URL
+    Download car data from the given URL and return the raw JSON bytes
     """
     if headers is None:
         headers = {
@@ -25,10 +36,10 @@ def download_car_data(url, headers=None):
         }
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = get_with_retry(get_session(), url, limiter, headers=headers, timeout=30)
 
-        if response.status_code == 200:
-            return response.json()
+        if response.status_code == 200 and response.content.lstrip()[:1] in (b'{', b'['):
+            return response.content
         else:
             print(f"Failed to download data from {url}. Status code: {response.status_code}")
             return None
@@ -39,20 +50,24 @@ def download_car_data(url, headers=None):
 
 def save_to_s3(data, bucket_name, key):
     """
-    Save JSON data to S3 bucket
+    Save raw JSON bytes to S3 bucket in the configured storage mode
     """
     try:
-        s3_client = boto3.client('s3')
-
-        # Convert data to JSON string
-        json_data = json.dumps(data, ensure_ascii=False, indent=2)
+        if STORAGE_MODE == 'json':
+            body = json.dumps(json.loads(data), ensure_ascii=False, indent=2).encode('utf-8')
+            encoding = {}
+        else:
+            # Readers decompress based on Content-Encoding, so the key keeps its .json suffix
+            body = gzip.compress(data)
+            encoding = {'ContentEncoding': 'gzip'}
 
         # Upload to S3
         s3_client.put_object(
             Bucket=bucket_name,
             Key=key,
-            Body=json_data,
-            ContentType='application/json'
+            Body=body,
+            ContentType='application/json',
+            **encoding
         )
 
         print(f"Successfully saved data to s3://{bucket_name}/{key}")
@@ -75,14 +90,53 @@ def extract_page_from_url(url):
         print(f"Error extracting page from URL {url}: {str(e)}")
         return 'unknown'
 
+def unpack_message(message):
+    """
+    Return the (page, url) items of one SQS message.
+
+    Accepts the packed {'url': base_url, 'pages': [...]} envelope as well as
+    the single-page {'page': ..., 'url': ...} format.
+    """
+    if 'pages' in message:
+        return [(page, f"{message['url']}{page}") for page in message['pages']]
+    return [(message.get('page'), message.get('url'))]
+
+def process_page(page, url, s3_bucket):
+    """Download one search page and save it to S3, returning True on success"""
+    print(f"Processing page {page}: {url}")
+
+    # Download data from the URL
+    data = download_car_data(url)
+
+    if data is None:
+        print(f"Failed to download data for page {page}")
+        return False
+
+    # Create S3 key (folder structure: car-data/page_XXX.json)
+    if page:
+        s3_key = f"car-data/page_{page}.json"
+    else:
+        # Fallback: extract page from URL
+        extracted_page = extract_page_from_url(url)
+        s3_key = f"car-data/page_{extracted_page}.json"
+
+    # Save data to S3
+    return save_to_s3(data, s3_bucket, s3_key)
+
 def lambda_handler(event, context):
     """
     AWS Lambda function to process SQS messages containing car search URLs,
-    download data, and save to S3
+    download data, and save to S3.
+
+    The pages of every message in the batch are downloaded concurrently. A
+    message with any failed page is reported in batchItemFailures so SQS
+    redelivers it; its saved pages are simply overwritten on the retry.
     """
+    invocation = begin_invocation()
 
     # Get S3 bucket name from environment variable
     s3_bucket = os.environ.get('S3_BUCKET_NAME')
+    max_workers = int(os.environ.get('FETCH_CONCURRENCY', '8'))
 
     if not s3_bucket:
         print("Error: S3_BUCKET_NAME environment variable not set")
@@ -96,56 +150,49 @@ def lambda_handler(event, context):
     processed_messages = 0
     successful_downloads = 0
     failed_downloads = 0
-
-    # Process each SQS record
-    for record in event.get('Records', []):
-        try:
-            # Parse the message body
-            message_body = json.loads(record['body'])
-            page = message_body.get('page')
-            url = message_body.get('url')
-            timestamp = message_body.get('timestamp', 'unknown')
-
-            if not url:
-                print(f"Warning: No URL found in message {record.get('messageId', 'unknown')}")
-                continue
-
-            print(f"Processing message for page {page}: {url}")
-
-            # Download data from the URL
-            data = download_car_data(url)
-
-            if data is None:
+    failed_message_ids = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_message = {}
+
+        # Process each SQS record
+        for record in event.get('Records', []):
+            message_id = record.get('messageId', 'unknown')
+            try:
+                # Parse the message body
+                items = unpack_message(json.loads(record['body']))
+            except Exception as e:
+                # A malformed body never parses, so it is not sent back to the queue
+                print(f"Error parsing message {message_id}: {str(e)}")
                 failed_downloads += 1
-                print(f"Failed to download data for page {page}")
                 continue
 
-            # Create S3 key (folder structure: car-data/page_XXX.json)
-            if page:
-                s3_key = f"car-data/page_{page}.json"
-            else:
-                # Fallback: extract page from URL
-                extracted_page = extract_page_from_url(url)
-                s3_key = f"car-data/page_{extracted_page}.json"
-
-            # Save data to S3
-            success = save_to_s3(data, s3_bucket, s3_key)
+            processed_messages += 1
+            for page, url in items:
+                if not url:
+                    print(f"Warning: No URL found in message {message_id}")
+                    continue
+                future_to_message[executor.submit(process_page, page, url, s3_bucket)] = message_id
+
+        for future in as_completed(future_to_message):
+            message_id = future_to_message[future]
+            try:
+                success = future.result()
+            except Exception as e:
+                print(f"Error processing message {message_id}: {str(e)}")
+                success = False
 
             if success:
                 successful_downloads += 1
             else:
                 failed_downloads += 1
+                failed_message_ids.add(message_id)
 
-            processed_messages += 1
-
-        except json.JSONDecodeError as e:
-            print(f"Error parsing message body: {str(e)}")
-            failed_downloads += 1
-        except Exception as e:
-            print(f"Error processing message: {str(e)}")
-            failed_downloads += 1
+    total_downloads = successful_downloads + failed_downloads
+    emit_timing('lambda_step2', invocation, total_downloads)
 
-    # Return summary
+    # Return summary; batchItemFailures needs ReportBatchItemFailures on the
+    # event source mapping
     result = {
         'statusCode': 200,
         'body': json.dumps({
@@ -153,8 +200,9 @@ def lambda_handler(event, context):
             'processed_messages': processed_messages,
             'successful_downloads': successful_downloads,
             'failed_downloads': failed_downloads,
-            'success_rate': f"{(successful_downloads/processed_messages)*100:.1f}%" if processed_messages > 0 else "0%"
-        })
+            'success_rate': f"{(successful_downloads/total_downloads)*100:.1f}%" if total_downloads > 0 else "0%"
+        }),
+        'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed_message_ids)]
     }
 
     print(f"Lambda execution completed: {result['body']}")
@@ -1,8 +1,28 @@
 import json
-import boto3
+import gzip
+import time
 import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from botocore.exceptions import ClientError
 
+from sqs_producer import send_messages
+from lambda_runtime import s3, sqs, lambda_client, begin_invocation, emit_timing
+
+# Number of S3 GETs kept in flight while scanning
+MAX_WORKERS = int(os.environ.get('SCAN_CONCURRENCY', '32'))
+
+# Number of SendMessageBatch calls kept in flight
+SEND_CONCURRENCY = int(os.environ.get('SEND_CONCURRENCY', '8'))
+
+# Number of ad ids carried by one SQS message
+PACK_SIZE = int(os.environ.get('PACK_SIZE', '10'))
+
+# Stop scanning when less than this much of the invocation is left
+TIME_BUDGET_MARGIN_MS = int(os.environ.get('TIME_BUDGET_MARGIN_MS', '60000'))
+
+# Ads sent within this many hours are not queued again
+DEDUPE_TTL_SECONDS = float(os.environ.get('DEDUPE_TTL_HOURS', '24')) * 3600
+
 def extract_car_links(data):
     """
     Extract car links from JSON data
@@ -14,68 +34,264 @@ def extract_car_links(data):
                 links.append(car['link'])
     return links
 
-def send_links_to_sqs(links, queue_url):
+def ad_id_from_link(link):
+    return link.rstrip('/').split('/')[-1]
+
+def load_sent_index(bucket, key):
     """
-    Send car links to SQS queue in batches
+    Load the {ad_id: sent_at} index of ads already queued, empty if there is none yet
+    """
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return {}
+        raise
+    return json.loads(gzip.decompress(response['Body'].read()))
+
+def save_sent_index(bucket, key, sent_index):
+    """
+    Save the sent-ads index, dropping entries older than the TTL
+    """
+    cutoff = time.time() - DEDUPE_TTL_SECONDS
+    fresh = {ad_id: sent_at for ad_id, sent_at in sent_index.items() if sent_at >= cutoff}
+    body = gzip.compress(json.dumps(fresh, separators=(',', ':')).encode('utf-8'))
+    s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/json', ContentEncoding='gzip')
+
+def filter_new_links(links, sent_index, seen_ids=None):
+    """
+    Drop links whose ad was sent within the TTL, or already appears in `seen_ids`
+    """
+    cutoff = time.time() - DEDUPE_TTL_SECONDS
+    seen_ids = seen_ids if seen_ids is not None else set()
+    new_links = []
+    for link in links:
+        ad_id = ad_id_from_link(link)
+        if ad_id in seen_ids or sent_index.get(ad_id, 0) >= cutoff:
+            continue
+        seen_ids.add(ad_id)
+        new_links.append(link)
+    return new_links
+
+def send_links_to_sqs(links, queue_url, sent_index=None):
+    """
+    Send car links to SQS queue as {'ad_ids': [...]} messages of PACK_SIZE ads,
+    in concurrent batches, retrying failed entries.
+
+    With a sent_index, ads sent within the TTL are skipped and every
+    successfully sent ad is recorded in it. Returns (ads sent, ads failed).
     """
+    if sent_index is not None:
+        links = filter_new_links(links, sent_index)
+
     if not links:
         return 0, 0
 
-    sqs = boto3.client('sqs')
-    sent = 0
-    failed = 0
-
-    for i in range(0, len(links), 10):
-        batch = links[i:i + 10]
-        entries = [{'Id': str(j), 'MessageBody': json.dumps({'link': link})} 
-                   for j, link in enumerate(batch)]
+    ad_ids = [ad_id_from_link(link) for link in links]
+    packs = [ad_ids[i:i + PACK_SIZE] for i in range(0, len(ad_ids), PACK_SIZE)]
+    bodies = [json.dumps({'ad_ids': pack}) for pack in packs]
+    result = send_messages(sqs, queue_url, bodies, max_workers=SEND_CONCURRENCY)
 
-        try:
-            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
-            sent += len(response.get('Successful', []))
-            failed += len(response.get('Failed', []))
-        except ClientError as e:
-            print(f"Error sending batch: {str(e)}")
-            failed += len(batch)
+    if sent_index is not None:
+        now = time.time()
+        for index in result['successful_indexes']:
+            for ad_id in packs[index]:
+                sent_index[ad_id] = now
 
-    return sent, failed
+    sent = sum(len(packs[index]) for index in result['successful_indexes'])
+    return sent, len(ad_ids) - sent
 
 def read_json_from_s3(bucket, key):
     """
-    Read JSON file from S3 bucket
+    Read JSON file from S3 bucket, decompressing gzip-encoded objects
     """
-    s3 = boto3.client('s3')
     response = s3.get_object(Bucket=bucket, Key=key)
-    return json.loads(response['Body'].read().decode('utf-8'))
-
-def list_s3_json_files(bucket, prefix=''):
-    """
-    List all JSON files in S3 bucket
-    """
-    s3 = boto3.client('s3')
-    json_files = []
-    paginator = s3.get_paginator('list_objects_v2')
-    
-    pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
-    
-    for page in pages:
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                if obj['Key'].endswith('.json'):
-                    json_files.append(obj['Key'])
-    
-    print(f"Found {len(json_files)} JSON files in s3://{bucket}/{prefix}")
-    return json_files
+    body = response['Body'].read()
+    if response.get('ContentEncoding') == 'gzip':
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+def list_json_keys_page(bucket, prefix, continuation_token=None):
+    """
+    List one page of keys and return (json keys, next continuation token)
+    """
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if continuation_token:
+        params['ContinuationToken'] = continuation_token
+    response = s3.list_objects_v2(**params)
+
+    keys = [obj['Key'] for obj in response.get('Contents', []) if obj['Key'].endswith('.json')]
+    return keys, response.get('NextContinuationToken')
+
+def read_links_from_s3(bucket, key):
+    """
+    Read one page JSON from S3 and return its car links
+    """
+    return extract_car_links(read_json_from_s3(bucket, key))
+
+def new_stats():
+    return {
+        'files_found': 0,
+        'files_processed': 0,
+        'files_failed': 0,
+        'links_extracted': 0,
+        'links_skipped': 0,
+        'links_sent': 0,
+        'failed_sends': 0
+    }
+
+def load_checkpoint(bucket, key):
+    """
+    Load the scan checkpoint, or None if there is no scan to resume
+    """
+    try:
+        checkpoint = read_json_from_s3(bucket, key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return checkpoint if not checkpoint.get('complete') else None
+
+def save_checkpoint(bucket, key, checkpoint):
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(checkpoint), ContentType='application/json')
+
+def acquire_lease(bucket, key, owner, seconds):
+    """
+    Take the scan lease with a conditional put, so only one invocation at a time
+    uses the checkpoint and the sent index. An expired lease is taken over only
+    if nobody changed it since it was read. Returns the lease ETag, or None when
+    another scan holds it.
+    """
+    body = json.dumps({'owner': owner, 'expires': time.time() + seconds})
+    try:
+        return s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/json',
+                             IfNoneMatch='*')['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            raise
+
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        if json.loads(response['Body'].read())['expires'] > time.time():
+            return None
+        return s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/json',
+                             IfMatch=response['ETag'])['ETag']
+    except ClientError as e:
+        # Released or taken over by another invocation in the meantime
+        if e.response['Error']['Code'] in ('NoSuchKey', '404', 'PreconditionFailed', 'ConditionalRequestConflict'):
+            return None
+        raise
+
+def release_lease(bucket, key, etag):
+    """
+    Delete the lease, unless it expired and another invocation took it over
+    """
+    try:
+        s3.delete_object(Bucket=bucket, Key=key, IfMatch=etag)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404', 'PreconditionFailed'):
+            raise
+
+def scan_and_send(bucket, prefix, queue_url, continuation_token=None, stats=None, sent_index=None,
+                  out_of_time=lambda: False, on_page_done=None, skip_keys=(), max_workers=MAX_WORKERS):
+    """
+    Stream keys into a bounded pool of GETs and fill SQS batches across file boundaries.
+
+    Works one listing page at a time: every key of a page is read and its links
+    sent before `on_page_done(next_token, stats)` records progress, so a resumed
+    scan never resends a page. Returns (stats, next token or None when finished).
+    """
+    stats = stats or new_stats()
+    stats.setdefault('links_skipped', 0)
+    pending_links = []
+    queued_ids = set()
+
+    def send_pending(flush):
+        # Wait until there are enough full batches of 10 full messages to keep
+        # every sender busy; on flush send everything including the remainder
+        batch_links = 10 * PACK_SIZE
+        if not flush and len(pending_links) < SEND_CONCURRENCY * batch_links:
+            return
+        count = len(pending_links) if flush else len(pending_links) - len(pending_links) % batch_links
+        if count:
+            sent, failed = send_links_to_sqs(pending_links[:count], queue_url, sent_index)
+            stats['links_sent'] += sent
+            stats['failed_sends'] += failed
+            del pending_links[:count]
+
+    def collect(done, in_flight):
+        for future in done:
+            key = in_flight.pop(future)
+            try:
+                links = future.result()
+                stats['links_extracted'] += len(links)
+                stats['files_processed'] += 1
+                if sent_index is not None:
+                    # Filter before batching so batches stay full of new ads
+                    new_links = filter_new_links(links, sent_index, queued_ids)
+                    stats['links_skipped'] += len(links) - len(new_links)
+                    links = new_links
+                pending_links.extend(links)
+                print(f"Processed {key}: {len(links)} links")
+            except Exception as e:
+                print(f"Error processing {key}: {str(e)}")
+                stats['files_failed'] += 1
+        send_pending(flush=False)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            keys, next_token = list_json_keys_page(bucket, prefix, continuation_token)
+            keys = [key for key in keys if key not in skip_keys]
+            stats['files_found'] += len(keys)
+
+            in_flight = {}
+            for key in keys:
+                in_flight[executor.submit(read_links_from_s3, bucket, key)] = key
+
+                # Keep the number of queued GETs bounded
+                if len(in_flight) >= max_workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done, in_flight)
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done, in_flight)
+
+            send_pending(flush=True)
+            continuation_token = next_token
+            if on_page_done:
+                on_page_done(continuation_token, stats)
+
+            if not continuation_token or out_of_time():
+                break
+
+    print(f"Found {stats['files_found']} JSON files in s3://{bucket}/{prefix} so far")
+    return stats, continuation_token
 
 def lambda_handler(event, context):
     """
-    AWS Lambda function to scan all JSON files in S3 bucket, extract car links, and send to SQS
+    AWS Lambda function to scan all JSON files in S3 bucket, extract car links, and send to SQS.
+
+    The scan stops before the invocation times out and saves its position in a
+    checkpoint object. The next invocation resumes from there: automatically when
+    SELF_INVOKE is set, otherwise by invoking again (optionally passing the
+    returned 'cursor'). Pass {"restart": true} to start over.
+
+    An invocation that finds another scan holding the lease returns 409 without
+    touching the checkpoint or the sent index.
     """
+    invocation = begin_invocation()
+    event = event or {}
 
     # Get environment variables
     sqs_queue_url = os.environ.get('SQS_QUEUE_URL')
     s3_bucket = os.environ.get('S3_BUCKET_NAME', 'blocked-data-15')
     s3_prefix = os.environ.get('S3_PREFIX', '')
+    checkpoint_key = os.environ.get('CHECKPOINT_KEY', 'checkpoints/lambda_step3.json')
+    lease_key = os.environ.get('LEASE_KEY', 'checkpoints/lambda_step3.lease')
+    sent_index_key = os.environ.get('SENT_INDEX_KEY', 'checkpoints/sent_ads.json.gz')
+    dedupe = os.environ.get('DEDUPE', 'true').lower() == 'true'
+    self_invoke = os.environ.get('SELF_INVOKE', 'false').lower() == 'true'
 
     if not sqs_queue_url:
         return {
@@ -85,12 +301,71 @@ def lambda_handler(event, context):
             })
         }
 
-    print(f"Starting scan of s3://{s3_bucket}/{s3_prefix}")
+    # Held until this invocation ends; a crashed scan's lease expires with its timeout
+    lease_seconds = context.get_remaining_time_in_millis() / 1000 if context is not None else 900
+    lease = acquire_lease(s3_bucket, lease_key, getattr(context, 'aws_request_id', 'local'), lease_seconds)
+    if not lease:
+        return {
+            'statusCode': 409,
+            'body': json.dumps({
+                'error': f'Another scan holds s3://{s3_bucket}/{lease_key}'
+            })
+        }
+
+    try:
+        checkpoint = None if event.get('restart') else load_checkpoint(s3_bucket, checkpoint_key)
+        continuation_token = event.get('cursor') or (checkpoint or {}).get('continuation_token')
+        stats = (checkpoint or {}).get('stats') if continuation_token else None
+
+        if continuation_token:
+            print(f"Resuming scan of s3://{s3_bucket}/{s3_prefix}")
+        else:
+            print(f"Starting scan of s3://{s3_bucket}/{s3_prefix}")
+
+        def out_of_time():
+            return context is not None and context.get_remaining_time_in_millis() < TIME_BUDGET_MARGIN_MS
+
+        sent_index = load_sent_index(s3_bucket, sent_index_key) if dedupe else None
+
+        def on_page_done(next_token, page_stats):
+            # Save the index first so a resumed scan never resends this page's ads
+            if sent_index is not None:
+                save_sent_index(s3_bucket, sent_index_key, sent_index)
+            save_checkpoint(s3_bucket, checkpoint_key, {
+                'prefix': s3_prefix,
+                'continuation_token': next_token,
+                'stats': page_stats,
+                'complete': next_token is None
+            })
+
+        # Stats of a resumed scan are cumulative; time only this invocation's files
+        files_before = (stats or {}).get('files_processed', 0)
+
+        stats, continuation_token = scan_and_send(
+            s3_bucket, s3_prefix, sqs_queue_url,
+            continuation_token=continuation_token,
+            stats=stats,
+            sent_index=sent_index,
+            out_of_time=out_of_time,
+            on_page_done=on_page_done,
+            skip_keys={checkpoint_key}
+        )
+
+        complete = continuation_token is None
+        emit_timing('lambda_step3', invocation, stats['files_processed'] - files_before)
+    finally:
+        # Released before re-invoking, so the next invocation can take it
+        release_lease(s3_bucket, lease_key, lease)
 
-    # List all JSON files in S3
-    json_files = list_s3_json_files(s3_bucket, s3_prefix)
+    if not complete and self_invoke and context is not None:
+        lambda_client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'cursor': continuation_token})
+        )
+        print("Time budget reached, re-invoked to continue the scan")
 
-    if not json_files:
+    if not stats['files_found']:
         return {
             'statusCode': 200,
             'body': json.dumps({
@@ -99,45 +374,33 @@ def lambda_handler(event, context):
                 'links_extracted': 0,
                 'links_sent': 0,
                 'failed_sends': 0,
-                'success_rate': '0%'
+                'success_rate': '0%',
+                'complete': True,
+                'cursor': None
             })
         }
 
-    total_links_extracted = 0
-    total_links_sent = 0
-    total_failed_sends = 0
-    files_processed = 0
-    files_failed = 0
-
-    # Process each JSON file
-    for key in json_files:
-        try:
-            data = read_json_from_s3(s3_bucket, key)
-            links = extract_car_links(data)
-            total_links_extracted += len(links)
-
-            sent, failed = send_links_to_sqs(links, sqs_queue_url)
-            total_links_sent += sent
-            total_failed_sends += failed
-            files_processed += 1
-
-            print(f"Processed {key}: {len(links)} links, {sent} sent")
-        except Exception as e:
-            print(f"Error processing {key}: {str(e)}")
-            files_failed += 1
+    total_links_extracted = stats['links_extracted']
+    total_links_sent = stats['links_sent']
+    total_failed_sends = stats['failed_sends']
+    files_processed = stats['files_processed']
+    files_failed = stats['files_failed']
 
     # Return summary
     result = {
         'statusCode': 200,
         'body': json.dumps({
-            'message': f'Processed {files_processed} files ({files_failed} failed), extracted {total_links_extracted} links, sent {total_links_sent} to SQS',
-            'files_found': len(json_files),
+            'message': f'Processed {files_processed} files ({files_failed} failed), extracted {total_links_extracted} links, skipped {stats["links_skipped"]} already queued, sent {total_links_sent} to SQS',
+            'files_found': stats['files_found'],
             'files_processed': files_processed,
             'files_failed': files_failed,
             'links_extracted': total_links_extracted,
+            'links_skipped': stats['links_skipped'],
             'links_sent': total_links_sent,
             'failed_sends': total_failed_sends,
-            'success_rate': f"{(total_links_sent/(total_links_sent + total_failed_sends))*100:.1f}%" if (total_links_sent + total_failed_sends) > 0 else "0%"
+            'success_rate': f"{(total_links_sent/(total_links_sent + total_failed_sends))*100:.1f}%" if (total_links_sent + total_failed_sends) > 0 else "0%",
+            'complete': complete,
+            'cursor': continuation_token
         })
     }
 
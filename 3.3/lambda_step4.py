@@ -1,10 +1,21 @@
 import json
-import boto3
 import os
 import csv
+import gzip
+import uuid
 from io import StringIO
 from datetime import datetime
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from blocket_throttle import AdaptiveLimiter, get_with_retry
+from car_fields import FLAT_FIELDS, extract_parameters
+from lambda_runtime import get_session, s3 as s3_client, sqs, begin_invocation, emit_timing
+
+# Reused across warm invocations so the limit keeps what it learned
+limiter = AdaptiveLimiter(initial=4, maximum=16)
+
+# An ad that keeps failing transiently is queued again at most this many times
+MAX_AD_ATTEMPTS = int(os.environ.get('MAX_AD_ATTEMPTS', '5'))
 
 def extract_important_fields(data):
     """
@@ -12,11 +23,8 @@ def extract_important_fields(data):
     """
     d = data.get('data', {})
     
-    # Extract parameters
-    params = {}
-    for group in d.get('parameter_groups', []):
-        for param in group.get('parameters', []):
-            params[param.get('id')] = param.get('value')
+    # Extract parameters in one pass over the shared field spec
+    params = extract_parameters(d, FLAT_FIELDS)
     
     return {
         'ad_id': d.get('ad_id'),
@@ -26,9 +34,9 @@ def extract_important_fields(data):
         'share_url': d.get('share_url'),
         'seller_name': d.get('advertiser', {}).get('name'),
         'seller_type': d.get('advertiser', {}).get('type'),
-        'brand': params.get('car_brand') or params.get('cx_make'),
-        'model': params.get('level_1') or params.get('cx_model'),
-        'year': params.get('regdate'),
+        'brand': params.get('brand'),
+        'model': params.get('model'),
+        'year': params.get('year'),
         'mileage': params.get('mileage'),
         'fuel': params.get('fuel'),
         'gearbox': params.get('gearbox'),
@@ -36,11 +44,10 @@ def extract_important_fields(data):
         'zipcode': d.get('zipcode')
     }
 
-def download_json_from_link(link):
+def download_json_for_ad(ad_id):
     """
-    Download JSON data from Blocket API
+    Download the JSON data of one ad id from Blocket API
     """
-    ad_id = link.split('/')[-1]
     api_url = f"https://api.blocket.se/search_bff/v2/content/{ad_id}?include=store&include=partner_placements&include=breadcrumbs&include=archived&include=car_condition&include=home_delivery&include=realestate&status=active&status=deleted&status=hidden_by_user"
     
     headers = {
@@ -50,52 +57,159 @@ def download_json_from_link(link):
         'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
     }
     
-    response = requests.get(api_url, headers=headers, timeout=30)
+    response = get_with_retry(get_session(), api_url, limiter, headers=headers, timeout=30)
     response.raise_for_status()
     return response.json()
 
 def save_to_s3(bucket, key, data):
-    s3 = boto3.client('s3')
-    s3.put_object(Bucket=bucket, Key=key, Body=data)
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=data,
+        ContentType='text/csv',
+        ContentEncoding='gzip'
+    )
+
+def unpack_message(message):
+    """
+    Return the ad ids of one SQS message.
+
+    Accepts the packed {'ad_ids': [...]} envelope as well as the
+    single-ad {'link': ...} format.
+    """
+    if 'ad_ids' in message:
+        return [str(ad_id) for ad_id in message['ad_ids']]
+    return [message['link'].rstrip('/').split('/')[-1]]
+
+def is_permanent_failure(error):
+    """
+    True for a 4xx other than 429, e.g. a 404 on a removed ad, which fails
+    the same way however often it is retried
+    """
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+def queue_url_of(arn):
+    """Queue URL of an SQS event source ARN, arn:aws:sqs:<region>:<account>:<name>"""
+    _, _, _, _, account, name = arn.split(':')
+    return sqs.get_queue_url(QueueName=name, QueueOwnerAWSAccountId=account)['QueueUrl']
+
+def requeue_ads(record, ad_ids, attempt):
+    """
+    Send ads that failed transiently back to the source queue as a new
+    message, delayed by exponential backoff, so the rest of their message is
+    not fetched again. Returns False if the ads could not be queued.
+    """
+    try:
+        sqs.send_message(
+            QueueUrl=queue_url_of(record['eventSourceARN']),
+            MessageBody=json.dumps({'ad_ids': ad_ids, 'attempt': attempt + 1}),
+            DelaySeconds=min(900, 30 * 2 ** attempt)
+        )
+        print(f"Queued {len(ad_ids)} failed ads again (attempt {attempt + 2})")
+        return True
+    except Exception as e:
+        print(f"Error queueing failed ads {ad_ids}: {str(e)}")
+        return False
+
+def process_ad(ad_id):
+    """Download and flatten one ad"""
+    print(f"Processing ad: {ad_id}")
+    
+    json_data = download_json_for_ad(ad_id)
+    return extract_important_fields(json_data)
+
+def rows_to_gzip_csv(rows):
+    """Serialize rows to one gzip-compressed CSV with a single header"""
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=rows[0].keys())
+    writer.writeheader()
+    writer.writerows(rows)
+    return gzip.compress(output.getvalue().encode('utf-8'))
 
 def lambda_handler(event, context):
+    invocation = begin_invocation()
     s3_bucket = os.environ.get('S3_BUCKET_NAME', 'blocked-data-15')
     s3_prefix = os.environ.get('S3_PREFIX', 'flat/')
+    max_workers = int(os.environ.get('FETCH_CONCURRENCY', '16'))
+    
+    records = event['Records']
+    record_rows = {}
+    retry_ads = {}
+    attempts = {}
+    dropped = 0
+    
+    # Fetch every ad of every message in the batch concurrently over the shared session
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_ad = {}
+        for record in records:
+            message_id = record['messageId']
+            try:
+                message = json.loads(record['body'])
+                ad_ids = unpack_message(message)
+            except Exception as e:
+                # A malformed body never parses, so it is not sent back to the queue
+                print(f"Error parsing message {message_id}: {str(e)}")
+                continue
+            record_rows[message_id] = []
+            retry_ads[message_id] = []
+            attempts[message_id] = int(message.get('attempt', 0))
+            for ad_id in ad_ids:
+                future_to_ad[executor.submit(process_ad, ad_id)] = (message_id, ad_id)
+        
+        for future in as_completed(future_to_ad):
+            message_id, ad_id = future_to_ad[future]
+            try:
+                record_rows[message_id].append(future.result())
+            except Exception as e:
+                if is_permanent_failure(e):
+                    print(f"Dropping ad {ad_id} of message {message_id}: {str(e)}")
+                    dropped += 1
+                else:
+                    print(f"Error processing ad {ad_id} of message {message_id}: {str(e)}")
+                    retry_ads[message_id].append(ad_id)
     
-    processed = 0
-    failed = 0
+    # Rows of failed ads are simply missing; the ads that succeeded are written
+    rows = [row for message_rows in record_rows.values() for row in message_rows]
+    failures = []
     
-    for record in event['Records']:
+    # One object per invocation instead of one per ad
+    if rows:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        request_id = context.aws_request_id if context else uuid.uuid4().hex
+        s3_key = f"{s3_prefix}batch_{timestamp}_{request_id}.csv.gz"
+        
         try:
-            message = json.loads(record['body'])
-            link = message['link']
-            
-            print(f"Processing link: {link}")
-            
-            json_data = download_json_from_link(link)
-            row_data = extract_important_fields(json_data)
-            
-            # Convert to CSV
-            output = StringIO()
-            writer = csv.DictWriter(output, fieldnames=row_data.keys())
-            writer.writeheader()
-            writer.writerow(row_data)
-            csv_data = output.getvalue()
-            
-            # Save to S3
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            ad_id = link.split('/')[-1]
-            s3_key = f"{s3_prefix}{ad_id}_{timestamp}.csv"
-            
-            save_to_s3(s3_bucket, s3_key, csv_data)
-            print(f"Saved to s3://{s3_bucket}/{s3_key}")
-            processed += 1
-                
+            save_to_s3(s3_bucket, s3_key, rows_to_gzip_csv(rows))
+            print(f"Saved {len(rows)} rows to s3://{s3_bucket}/{s3_key}")
         except Exception as e:
-            print(f"Error processing {link}: {str(e)}")
-            failed += 1
+            print(f"Error saving batch to S3: {str(e)}")
+            failures = [{'itemIdentifier': message_id} for message_id in record_rows]
+            rows = []
+    
+    # Only the ads that failed transiently are fetched again. If they cannot be
+    # queued, their whole message is redelivered; compaction keeps one row per ad.
+    retried = 0
+    if not failures:
+        for record in records:
+            ad_ids = retry_ads.get(record['messageId'])
+            if not ad_ids:
+                continue
+            if attempts[record['messageId']] + 1 >= MAX_AD_ATTEMPTS:
+                print(f"Giving up on ads {ad_ids} after {MAX_AD_ATTEMPTS} attempts")
+                dropped += len(ad_ids)
+            elif requeue_ads(record, ad_ids, attempts[record['messageId']]):
+                retried += len(ad_ids)
+            else:
+                failures.append({'itemIdentifier': record['messageId']})
+    
+    emit_timing('lambda_step4', invocation, sum(len(message_rows) for message_rows in record_rows.values()))
     
+    # batchItemFailures needs ReportBatchItemFailures on the event source
+    # mapping; only the listed messages go back to the queue
     return {
         'statusCode': 200,
-        'body': json.dumps({'processed': processed, 'failed': failed})
+        'body': json.dumps({'processed': len(rows), 'retried': retried, 'dropped': dropped,
+                            'failed': len(failures)}),
+        'batchItemFailures': failures
     }
@@ -0,0 +1,98 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from blocket_throttle import retry_delay
+
+# SendMessageBatch limits
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+def pack_batches(bodies):
+    """
+    Group message bodies into batches of at most 10 entries and 256 KB.
+
+    Yields lists of (index, body) so callers can map results back to their input.
+    """
+    batch = []
+    batch_bytes = 0
+    for index, body in enumerate(bodies):
+        size = len(body.encode('utf-8'))
+        if batch and (len(batch) == MAX_BATCH_ENTRIES or batch_bytes + size > MAX_BATCH_BYTES):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append((index, body))
+        batch_bytes += size
+    if batch:
+        yield batch
+
+def send_batch(sqs, queue_url, batch, max_retries=3):
+    """
+    Send one batch, retrying only the entries SQS reports as failed.
+
+    Entries that failed through the sender's fault (e.g. invalid body) are
+    not retried. Returns (successful indexes, failed indexes).
+    """
+    pending = dict(batch)
+    successful = []
+    failed = []
+
+    for attempt in range(max_retries + 1):
+        entries = [{'Id': str(index), 'MessageBody': body} for index, body in pending.items()]
+        try:
+            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        except ClientError as e:
+            print(f"Error sending batch (attempt {attempt + 1}): {str(e)}")
+            if attempt < max_retries:
+                time.sleep(retry_delay(attempt, base=0.2))
+            continue
+
+        for entry in response.get('Successful', []):
+            successful.append(int(entry['Id']))
+            del pending[int(entry['Id'])]
+
+        for entry in response.get('Failed', []):
+            if entry.get('SenderFault'):
+                failed.append(int(entry['Id']))
+                del pending[int(entry['Id'])]
+
+        if not pending:
+            break
+        if attempt < max_retries:
+            time.sleep(retry_delay(attempt, base=0.2))
+
+    failed.extend(pending)
+    return successful, failed
+
+def send_messages(sqs, queue_url, bodies, max_workers=8, max_retries=3):
+    """
+    Send message bodies to SQS with concurrent SendMessageBatch calls over one client.
+
+    Returns a summary with counts, the successful and failed input indexes,
+    and the throughput in messages per second.
+    """
+    start = time.time()
+    successful = []
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(send_batch, sqs, queue_url, batch, max_retries)
+                   for batch in pack_batches(bodies)]
+        for future in futures:
+            batch_successful, batch_failed = future.result()
+            successful.extend(batch_successful)
+            failed.extend(batch_failed)
+
+    elapsed = time.time() - start
+    rate = len(successful) / elapsed if elapsed > 0 else 0.0
+    print(f"Sent {len(successful)} messages ({len(failed)} failed) in {elapsed:.2f}s, {rate:.1f} msg/s")
+
+    return {
+        'sent': len(successful),
+        'failed': len(failed),
+        'successful_indexes': successful,
+        'failed_indexes': failed,
+        'messages_per_second': rate
+    }
@@ -1,10 +1,16 @@
 import requests
 import os
+import sys
 import json
 import time
+import asyncio
 import multiprocessing
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import aiohttp
+
+from blocket_throttle import AdaptiveLimiter, AsyncAdaptiveLimiter, get_with_retry, get_with_retry_async
+
 # Create step1 folder if it doesn't exist
 if not os.path.exists('./step1'):
     os.makedirs('./step1')
@@ -27,14 +33,18 @@ headers = {
 # Base URL
 base_url = "https://api.blocket.se/motor-search-service/v4/search/car?page="
 
+# Per-process session and limiter for the process-pool mode
+session = requests.Session()
+limiter = AdaptiveLimiter()
+
 def download_page(page):
     """Download a single page and return the result"""
     try:
         # Construct the URL for current page
         url = f"{base_url}{page}"
 
-        # Make the request
-        response = requests.get(url, headers=headers)
+        # Make the request, backing off on 429/5xx
+        response = get_with_retry(session, url, limiter, headers=headers, timeout=30)
 
         # Check if request was successful
         if response.status_code == 200:
@@ -50,15 +60,46 @@ def download_page(page):
     except Exception as e:
         return f"Error downloading page {page}: {str(e)}"
 
-def main():
-    # Number of concurrent processes (adjust based on your system and API limits)
-    max_workers = min(8, multiprocessing.cpu_count())
+async def download_page_async(session, limiter, page):
+    """Download a single page over the shared aiohttp session"""
+    try:
+        url = f"{base_url}{page}"
 
-    print(f"Starting download with {max_workers} processes...")
+        # The limiter caps in-flight requests and retries 429/5xx; the session
+        # keeps the underlying TCP/TLS connections alive between pages
+        status, body = await get_with_retry_async(session, url, limiter, headers=headers)
+        if status != 200:
+            return f"Failed to download page {page} - Status code: {status}"
+        data = json.loads(body)
 
-    # Create a list of all pages to download
-    pages = list(range(1, 401))
+        filename = f"./step1/page_{page}.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+        return f"Successfully downloaded page {page}"
+
+    except Exception as e:
+        return f"Error downloading page {page}: {str(e)}"
 
+async def download_all_async(pages, concurrency):
+    """Download all pages from a single event loop with bounded concurrency"""
+    limiter = AsyncAdaptiveLimiter(initial=min(8, concurrency), maximum=concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=30)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [asyncio.create_task(download_page_async(session, limiter, page)) for page in pages]
+
+        completed = 0
+        for task in asyncio.as_completed(tasks):
+            print(await task)
+            completed += 1
+            if completed % 50 == 0:  # Progress update every 50 pages
+                print(f"Progress: {completed}/{len(pages)} pages completed "
+                      f"({limiter.rate():.1f} req/s, limit {int(limiter.limit)})")
+
+def download_all_processes(pages, max_workers):
+    """Download all pages with one worker process per concurrent request"""
     # Use ProcessPoolExecutor for multiprocessing
     with ProcessPoolExecutor(max_workers=max_workers) as executor:
         # Submit all tasks
@@ -73,11 +114,32 @@ def main():
                 print(result)
                 completed += 1
                 if completed % 50 == 0:  # Progress update every 50 pages
-                    print(f"Progress: {completed}/400 pages completed")
+                    print(f"Progress: {completed}/{len(pages)} pages completed")
             except Exception as exc:
                 print(f'Page {page} generated an exception: {exc}')
 
+def main(mode="async", concurrency=32):
+    # Create a list of all pages to download
+    pages = list(range(1, 401))
+
+    start = time.time()
+
+    if mode == "async":
+        print(f"Starting async download with {concurrency} concurrent requests...")
+        asyncio.run(download_all_async(pages, concurrency))
+    else:
+        # Number of concurrent processes (adjust based on your system and API limits)
+        max_workers = min(8, multiprocessing.cpu_count())
+        print(f"Starting download with {max_workers} processes...")
+        download_all_processes(pages, max_workers)
+
+    elapsed = time.time() - start
+    print(f"Downloaded {len(pages)} pages in {elapsed:.1f}s ({len(pages) / elapsed:.1f} pages/s)")
+
     print("Download process completed!")
 
 if __name__ == "__main__":
-    main()
+    # Usage: python step1.py [async|process] [concurrency]
+    mode = sys.argv[1] if len(sys.argv) > 1 else "async"
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    main(mode, concurrency)
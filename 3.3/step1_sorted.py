@@ -0,0 +1,117 @@
+import sys
+import json
+import time
+import asyncio
+from urllib.parse import quote_plus
+
+import aiohttp
+
+from step1 import headers
+from blocket_throttle import AsyncAdaptiveLimiter, get_with_retry_async
+
+# Search endpoint shared by every sort order
+search_url = "https://api.blocket.se/motor-search-service/v4/search/car"
+
+# Output suffix -> Blocket sortOrder value
+SORT_ORDERS = {
+    'cheapest': 'Billigast',
+    'expensive': 'Dyrast',
+    'highkm': 'Högst miltal',
+    'lowkm': 'Lägst miltal',
+    'latest': 'Senaste',
+    'oldest': 'Äldst',
+}
+
+def build_url(sort, page):
+    """Build the search URL for one (sort order, page) pair"""
+    return f"{search_url}?sortOrder={quote_plus(SORT_ORDERS[sort])}&page={page}"
+
+async def download_sorted_page(session, limiter, sort, page, seen_links):
+    """Download one page and write only the listings not seen under any sort order yet"""
+    try:
+        status, body = await get_with_retry_async(session, build_url(sort, page), limiter, headers=headers)
+        if status != 200:
+            return False, f"Failed to download {sort} page {page} - Status code: {status}"
+        data = json.loads(body)
+
+        # Every page is handled on the same event loop, so the shared set
+        # needs no locking between the check and the add
+        cars = data.get('cars') or []
+        new_cars = []
+        for car in cars:
+            link = car.get('link')
+            if link and link in seen_links:
+                continue
+            if link:
+                seen_links.add(link)
+            new_cars.append(car)
+        data['cars'] = new_cars
+
+        filename = f"./step1/page_{page}_{sort}.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+        return True, f"Downloaded {sort} page {page}: {len(new_cars)} new of {len(cars)} listings"
+
+    except Exception as e:
+        return False, f"Error downloading {sort} page {page}: {str(e)}"
+
+async def crawl(plan, concurrency):
+    """Crawl every (sort order, page) pair in the plan through one session"""
+    limiter = AsyncAdaptiveLimiter(initial=min(8, concurrency), maximum=concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=30)
+    seen_links = set()
+
+    jobs = [(sort, page) for sort, pages in plan.items() for page in pages]
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [asyncio.create_task(download_sorted_page(session, limiter, sort, page, seen_links))
+                 for sort, page in jobs]
+
+        completed = 0
+        failed = 0
+        for task in asyncio.as_completed(tasks):
+            success, message = await task
+            print(message)
+            completed += 1
+            if not success:
+                failed += 1
+            if completed % 50 == 0:  # Progress update every 50 pages
+                print(f"Progress: {completed}/{len(jobs)} pages completed "
+                      f"({limiter.rate():.1f} req/s, limit {int(limiter.limit)})")
+
+    return len(jobs), failed, len(seen_links)
+
+def parse_pages(text):
+    """Parse a page range such as '1-400' or '7'"""
+    if '-' in text:
+        first, last = text.split('-', 1)
+        return range(int(first), int(last) + 1)
+    return range(int(text), int(text) + 1)
+
+def parse_plan(text, default_pages):
+    """Parse 'cheapest:1-100,latest' into {sort order: page range}"""
+    plan = {}
+    for item in text.split(','):
+        sort, _, pages = item.partition(':')
+        plan[sort] = parse_pages(pages) if pages else default_pages
+    return plan
+
+def main(plan=None, concurrency=32):
+    plan = plan or {sort: range(1, 401) for sort in SORT_ORDERS}
+
+    print(f"Crawling sort orders {', '.join(plan)} with {concurrency} concurrent requests...")
+
+    start = time.time()
+    total, failed, unique = asyncio.run(crawl(plan, concurrency))
+    elapsed = time.time() - start
+
+    print(f"Downloaded {total - failed}/{total} pages in {elapsed:.1f}s, {unique} unique listings")
+    print("Download process completed!")
+
+if __name__ == "__main__":
+    # Usage: python step1_sorted.py [cheapest:1-400,latest:1-50,...] [concurrency]
+    plan = parse_plan(sys.argv[1], range(1, 401)) if len(sys.argv) > 1 else None
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    main(plan, concurrency)
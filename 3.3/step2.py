@@ -1,64 +1,86 @@
-import json
 import os
+import re
 import csv
+import json
 import glob
-
-def extract_car_links():
-    """Extract all car links from the JSON files in step1 folder"""
-    all_links = []
-
-    # Get all JSON files in step1 folder
-    json_files = glob.glob('./step1/*.json')
-
-    # Sort files by page number
-    json_files.sort(key=lambda x: int(x.split('_')[-2].split('.')[0]))
-
+import multiprocessing
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+
+PAGE_PATTERN = re.compile(r'page_(\d+)(?:_([a-z]+))?\.json$')
+
+def page_sort_key(json_file):
+    """Sort by sort order and then page number, for page_N.json and page_N_<sort>.json"""
+    match = PAGE_PATTERN.search(os.path.basename(json_file))
+    if not match:
+        return ('~', 0, json_file)
+    return (match.group(2) or '', int(match.group(1)), json_file)
+
+def extract_links_from_files(json_files):
+    """Extract every non-empty cars[].link from a batch of page files"""
+    links = []
     for json_file in json_files:
         try:
-            print(f"Processing {json_file}...")
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # Extract links from cars array
-            if 'cars' in data and isinstance(data['cars'], list):
-                for car in data['cars']:
-                    if 'link' in car and car['link']:
-                        all_links.append(car['link'])
-
+            with open(json_file, 'rb') as f:
+                data = json.loads(f.read())
+            if isinstance(data.get('cars'), list):
+                links.extend(car['link'] for car in data['cars'] if car.get('link'))
         except Exception as e:
             print(f"Error processing {json_file}: {str(e)}")
-
-    return all_links
-
-def create_csv_files(links, chunk_size=100):
+    return links
+
+def extract_car_links(step1_folder='./step1', max_workers=None, batch_size=200):
+    """Extract all unique car links from the JSON files in step1 folder"""
+    json_files = sorted(glob.glob(os.path.join(step1_folder, '*.json')), key=page_sort_key)
+    print(f"Found {len(json_files)} JSON files")
+
+    batches = [json_files[i:i + batch_size] for i in range(0, len(json_files), batch_size)]
+    max_workers = max_workers or min(8, multiprocessing.cpu_count())
+
+    # map() keeps batch order, so links come out in page order
+    unique_links = {}
+    if max_workers == 1:
+        # A single process only adds pickling overhead
+        for links in map(extract_links_from_files, batches):
+            for link in links:
+                unique_links[link] = None
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for links in executor.map(extract_links_from_files, batches):
+                for link in links:
+                    unique_links[link] = None
+
+    return list(unique_links)
+
+def create_csv_files(links, chunk_size=100, step2_folder='./step2'):
     """Create CSV files with chunks of links"""
     # Create step2 folder if it doesn't exist
-    if not os.path.exists('./step2'):
-        os.makedirs('./step2')
+    if not os.path.exists(step2_folder):
+        os.makedirs(step2_folder)
 
     # Split links into chunks of 100
     for i in range(0, len(links), chunk_size):
         chunk = links[i:i + chunk_size]
-        csv_filename = f"./step2/car_links_{i//chunk_size + 1}.csv"
+        csv_filename = os.path.join(step2_folder, f"car_links_{i//chunk_size + 1}.csv")
+
+        # Build the whole file in memory and write it in one call
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['link'])
+        writer.writerows([link] for link in chunk)
 
-        # Write chunk to CSV
         with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            # Write header
-            writer.writerow(['link'])
-            # Write links
-            for link in chunk:
-                writer.writerow([link])
+            csvfile.write(buffer.getvalue())
 
-        print(f"Created {csv_filename} with {len(chunk)} links")
+    print(f"Created {(len(links) + chunk_size - 1) // chunk_size} CSV files in {step2_folder}")
 
 def main():
     print("Starting link extraction...")
 
-    # Extract all car links
+    # Extract all unique car links
     all_links = extract_car_links()
 
-    print(f"Total links extracted: {len(all_links)}")
+    print(f"Total unique links extracted: {len(all_links)}")
 
     # Create CSV files with 100 links each
     create_csv_files(all_links, chunk_size=100)
@@ -1,75 +1,160 @@
-import requests
 import os
 import csv
 import sys
-import multiprocessing
+import time
+import sqlite3
 import random
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import asyncio
 
-def fetch_car_data(args):
+import aiohttp
+
+from blocket_throttle import AsyncAdaptiveLimiter, get_with_retry_async
+
+async def fetch_car_data(session, limiter, car_id, step3_folder, headers, base_url):
     """Fetch data for a single car ID"""
-    car_id, step3_folder, headers, base_url = args
-    
     try:
         api_url = base_url.format(car_id)
-        response = requests.get(api_url, headers=headers,timeout=5)
+        status, body = await get_with_retry_async(session, api_url, limiter, headers=headers)
         
-        if response.status_code == 200:
+        if status == 200:
             filename = os.path.join(step3_folder, f"{car_id}.json")
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            with open(filename, 'wb') as f:
+                f.write(body)
             return (True, car_id, None)
         else:
-            return (False, car_id, f"Status code: {response.status_code}")
+            return (False, car_id, f"Status code: {status}")
     except Exception as e:
         return (False, car_id, str(e))
 
-def process_single_csv(csv_filename, step3_folder, headers, base_url, max_workers):
-    """Process a single CSV file from step2 folder and fetch detailed data for each car"""
+def open_index(step3_folder):
+    """
+    Open the on-disk completion index, creating and seeding it on first use.
+
+    Car IDs that already have a step3/<car_id>.json from an older run are
+    recorded as done so they are not fetched again.
+    """
+    index_path = os.path.join(step3_folder, 'index.sqlite')
+    is_new = not os.path.exists(index_path)
+
+    conn = sqlite3.connect(index_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetches (
+            car_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            error TEXT
+        )
+    """)
+
+    if is_new:
+        existing = [(f[:-len('.json')], 'done', os.path.getmtime(os.path.join(step3_folder, f)))
+                    for f in os.listdir(step3_folder) if f.endswith('.json')]
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR REPLACE INTO fetches (car_id, status, fetched_at) VALUES (?, ?, ?)", existing)
+        conn.execute("COMMIT")
+        print(f"Seeded completion index with {len(existing)} existing files")
+
+    return conn
+
+def load_done_ids(conn, refresh_hours=None):
+    """Return the set of car IDs that are done and, in refresh mode, still fresh"""
+    cutoff = time.time() - refresh_hours * 3600 if refresh_hours else 0
+    rows = conn.execute("SELECT car_id FROM fetches WHERE status = 'done' AND fetched_at >= ?", (cutoff,))
+    return {row[0] for row in rows}
+
+def record_result(conn, car_id, success, error):
+    """Record the outcome of one fetch in the completion index"""
+    conn.execute(
+        "INSERT OR REPLACE INTO fetches (car_id, status, fetched_at, error) VALUES (?, ?, ?, ?)",
+        (car_id, 'done' if success else 'failed', time.time(), error)
+    )
+
+def read_car_ids(csv_path):
+    """Read the car IDs from one step2 CSV file"""
+    car_ids = []
+    with open(csv_path, 'r', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            link = row['link'].strip()
+            car_id = link.split('/annons/')[-1]
+            if car_id:
+                car_ids.append(car_id)
+    return car_ids
+
+async def feed_queue(queue, step2_folder, csv_files, done_ids, progress, workers):
+    """Stream car IDs from every CSV into the shared queue, skipping finished and duplicate IDs"""
+    queued_ids = set()
     
-    try:
-        print(f"\nProcessing: {os.path.basename(csv_filename)}")
-        
+    for csv_file in csv_files:
         car_ids = []
-        with open(csv_filename, 'r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                link = row['link'].strip()
-                car_id = link.split('/annons/')[-1]
-                if car_id:
-                    car_ids.append(car_id)
+        for car_id in read_car_ids(os.path.join(step2_folder, csv_file)):
+            if car_id not in done_ids and car_id not in queued_ids:
+                queued_ids.add(car_id)
+                car_ids.append(car_id)
         
-        print(f"Found {len(car_ids)} cars to process")
+        progress[csv_file] = {'pending': len(car_ids), 'processed': 0, 'errors': 0}
+        print(f"Queued {len(car_ids)} cars from {csv_file}")
+        if not car_ids:
+            print(f"Completed {csv_file}: nothing left to fetch")
         
-        args_list = [(car_id, step3_folder, headers, base_url) for car_id in car_ids]
+        # The queue is bounded, so this waits whenever the workers are busy
+        for car_id in car_ids:
+            await queue.put((csv_file, car_id))
+    
+    for _ in range(workers):
+        await queue.put(None)
+
+async def fetch_worker(queue, session, limiter, step3_folder, headers, base_url, index, done_ids, progress, totals):
+    """Take car IDs off the shared queue until the feeder sends the stop marker"""
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
         
-        processed_count = 0
-        error_count = 0
+        csv_file, car_id = item
+        success, car_id, error = await fetch_car_data(session, limiter, car_id, step3_folder, headers, base_url)
+        record_result(index, car_id, success, error)
         
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            future_to_car = {executor.submit(fetch_car_data, args): args[0] for args in args_list}
-            
-            for future in as_completed(future_to_car):
-                success, car_id, error = future.result()
-                if success:
-                    processed_count += 1
-                else:
-                    error_count += 1
-                    print(f"Failed to fetch car ID {car_id}: {error}")
-                
-                if (processed_count + error_count) % 50 == 0:
-                    print(f"Progress: {processed_count + error_count}/{len(car_ids)} completed")
+        file_progress = progress[csv_file]
+        file_progress['pending'] -= 1
+        if success:
+            done_ids.add(car_id)
+            file_progress['processed'] += 1
+            totals['processed'] += 1
+        else:
+            file_progress['errors'] += 1
+            totals['errors'] += 1
+            print(f"Failed to fetch car ID {car_id}: {error}")
         
-        print(f"Completed processing {csv_filename}")
-        print(f"Successfully processed: {processed_count} cars")
-        print(f"Errors: {error_count} cars")
-        return True
+        if file_progress['pending'] == 0:
+            print(f"Completed {csv_file}: {file_progress['processed']} cars, {file_progress['errors']} errors")
         
-    except Exception as e:
-        print(f"Error processing CSV file: {str(e)}")
-        return False
+        completed = totals['processed'] + totals['errors']
+        if completed % 50 == 0:
+            print(f"Progress: {completed} completed "
+                  f"({limiter.rate():.1f} req/s, limit {int(limiter.limit)})")
 
-def main():
+async def run_scheduler(step2_folder, csv_files, step3_folder, headers, base_url, concurrency, index, done_ids):
+    """Feed car IDs from all CSV files through one long-lived session and worker set"""
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    limiter = AsyncAdaptiveLimiter(initial=min(8, concurrency), maximum=concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=30)
+    progress = {}
+    totals = {'processed': 0, 'errors': 0}
+    
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        workers = [asyncio.create_task(fetch_worker(queue, session, limiter, step3_folder, headers, base_url,
+                                                    index, done_ids, progress, totals))
+                   for _ in range(concurrency)]
+        await feed_queue(queue, step2_folder, csv_files, done_ids, progress, concurrency)
+        await asyncio.gather(*workers)
+    
+    return totals
+
+def main(refresh_hours=None, concurrency=32):
     script_dir = os.path.dirname(os.path.abspath(__file__))
     step2_folder = os.path.join(script_dir, 'step2')
     step3_folder = os.path.join(script_dir, 'step3')
@@ -89,8 +174,7 @@ def main():
     
     base_url = "https://api.blocket.se/search_bff/v2/content/{}?include=store&include=partner_placements&include=breadcrumbs&include=archived&include=car_condition&include=home_delivery&include=realestate&status=active&status=deleted&status=hidden_by_user"
     
-    max_workers = min(32, multiprocessing.cpu_count())
-    print(f"Using {max_workers} processes")
+    print(f"Using {concurrency} concurrent requests")
     
     if not os.path.exists(step2_folder):
         print(f"Error: {step2_folder} folder not found")
@@ -103,26 +187,34 @@ def main():
         return
     
     print(f"Found {len(csv_files)} CSV files total")
-    print("Starting continuous random scraping (Ctrl+C to stop)\n")
     
-    processed_files = set()
+    index = open_index(step3_folder)
+    done_ids = load_done_ids(index, refresh_hours)
+    print(f"Skipping {len(done_ids)} car IDs already fetched" +
+          (f" within the last {refresh_hours} hours" if refresh_hours else ""))
+    print("Starting scraping (Ctrl+C to stop, progress is kept in the index)\n")
+    
+    # Spread the crawl across the whole result set rather than page order
+    random.shuffle(csv_files)
+    
+    start = time.time()
     
     try:
-        while len(processed_files) < len(csv_files):
-            # Select a random unprocessed CSV file
-            available_files = [f for f in csv_files if f not in processed_files]
-            random_csv = random.choice(available_files)
-            
-            print(f"\n[{len(processed_files) + 1}/{len(csv_files)}] Randomly selected: {random_csv}")
-            
-            csv_path = os.path.join(step2_folder, random_csv)
-            if process_single_csv(csv_path, step3_folder, headers, base_url, max_workers):
-                processed_files.add(random_csv)
+        totals = asyncio.run(run_scheduler(step2_folder, csv_files, step3_folder, headers, base_url,
+                                           concurrency, index, done_ids))
+        elapsed = time.time() - start
         
-        print("\n✓ All files processed!")
+        print(f"\n✓ All files processed! {totals['processed']} cars, {totals['errors']} errors "
+              f"in {elapsed:.1f}s")
     
     except KeyboardInterrupt:
-        print(f"\n\nStopped by user. Processed {len(processed_files)}/{len(csv_files)} files")
+        print(f"\n\nStopped by user. {len(done_ids)} car IDs are recorded as done")
+    
+    finally:
+        index.close()
 
 if __name__ == "__main__":
-    main()
+    # Usage: python step3.py [refresh_hours|-] [concurrency]
+    refresh_hours = float(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    main(refresh_hours, concurrency)
@@ -1,8 +1,43 @@
 import json
 import os
+import re
+import sys
 import csv
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from car_fields import FEATURE_FIELDS, extract_parameters
+
+FIELDNAMES = ['ad_id', 'price', 'subject', 'brand', 'model', 'model_family', 'model_year',
+              'mileage', 'fuel', 'gearbox', 'horsepower', 'color', 'drive_wheels',
+              'body_type', 'first_traffic_date', 'equipment_count', 'advertiser_type',
+              'region', 'municipality']
+
+# Typed schema for the Parquet output, numeric columns cleaned the same way as the 4.3 notebook
+PARQUET_SCHEMA = pa.schema([
+    ('ad_id', pa.int64()),
+    ('price', pa.int64()),
+    ('subject', pa.string()),
+    ('brand', pa.string()),
+    ('model', pa.string()),
+    ('model_family', pa.string()),
+    ('model_year', pa.int32()),
+    ('mileage', pa.int64()),
+    ('fuel', pa.string()),
+    ('gearbox', pa.string()),
+    ('horsepower', pa.int32()),
+    ('color', pa.string()),
+    ('drive_wheels', pa.string()),
+    ('body_type', pa.string()),
+    ('first_traffic_date', pa.string()),
+    ('equipment_count', pa.int32()),
+    ('advertiser_type', pa.string()),
+    ('region', pa.string()),
+    ('municipality', pa.string()),
+])
 
 def extract_car_features(json_file):
     """Extract relevant features from a single JSON file"""
@@ -19,36 +54,8 @@ def extract_car_features(json_file):
             'subject': car_data.get('subject', ''),
         }
         
-        # Extract from parameter_groups
-        for group in car_data.get('parameter_groups', []):
-            for param in group.get('parameters', []):
-                param_id = param.get('id')
-                param_value = param.get('value', '')
-                
-                if param_id == 'fuel':
-                    features['fuel'] = param_value
-                elif param_id == 'gearbox':
-                    features['gearbox'] = param_value
-                elif param_id == 'mileage':
-                    features['mileage'] = param_value.replace(' ', '')
-                elif param_id == 'regdate':
-                    features['model_year'] = param_value
-                elif param_id == 'cx_make':
-                    features['brand'] = param_value
-                elif param_id == 'cx_engine_power':
-                    features['horsepower'] = param_value
-                elif param_id == 'cx_model':
-                    features['model'] = param_value
-                elif param_id == 'cx_color':
-                    features['color'] = param_value
-                elif param_id == 'cx_first_time_in_traffic':
-                    features['first_traffic_date'] = param_value
-                elif param_id == 'cx_drive_wheels':
-                    features['drive_wheels'] = param_value
-                elif param_id == 'car_chassis_type':
-                    features['body_type'] = param_value
-                elif param_id == 'level_1':
-                    features['model_family'] = param_value
+        # Extract from parameter_groups in one pass over the shared field spec
+        features.update(extract_parameters(car_data, FEATURE_FIELDS))
         
         # Extract equipment count
         equipment_count = 0
@@ -71,48 +78,140 @@ def extract_car_features(json_file):
         print(f"Error processing {json_file}: {str(e)}")
         return None
 
-def process_json_files(step3_folder, output_csv, max_workers):
-    """Process all JSON files and create CSV"""
+def to_int(value):
+    """Keep only the digits of a value, None when there are none"""
+    digits = re.sub(r"[^\d]", "", str(value)) if value is not None else ''
+    return int(digits) if digits else None
+
+def extract_features_block(json_files):
+    """Extract features for a chunk of files and return them as one columnar block"""
+    block = {name: [] for name in FIELDNAMES}
+    for json_file in json_files:
+        features = extract_car_features(json_file)
+        if features:
+            for name in FIELDNAMES:
+                block[name].append(features.get(name, ''))
+    return block
+
+class CsvFeatureWriter:
+    """Write feature blocks to CSV as they arrive"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FIELDNAMES)
+
+    def write_block(self, block):
+        self.writer.writerows(zip(*(block[name] for name in FIELDNAMES)))
+
+    def close(self):
+        self.file.close()
+
+class ParquetFeatureWriter:
+    """Write feature blocks to a typed Parquet file, one row group per `row_group_size` rows"""
+
+    def __init__(self, path, row_group_size=50000):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(path, PARQUET_SCHEMA, compression='snappy')
+        self.columns = {name: [] for name in PARQUET_SCHEMA.names}
+        self.pending = 0
+
+    def write_block(self, block):
+        for field in PARQUET_SCHEMA:
+            values = block[field.name]
+            if pa.types.is_integer(field.type):
+                values = [to_int(value) for value in values]
+            else:
+                values = [value if value != '' else None for value in values]
+            self.columns[field.name].extend(values)
+        self.pending += len(block['ad_id'])
+        if self.pending >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(pa.table(self.columns, schema=PARQUET_SCHEMA))
+            self.columns = {name: [] for name in PARQUET_SCHEMA.names}
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def iter_chunks(step3_folder, chunk_size):
+    """Yield lists of up to `chunk_size` JSON paths, reading the directory lazily"""
+    chunk = []
+    with os.scandir(step3_folder) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json'):
+                chunk.append(entry.path)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+def process_json_files(step3_folder, output_path, max_workers, output_format='csv', chunk_size=500):
+    """
+    Process all JSON files in chunks and write the features as blocks arrive.
+
+    At most two chunks per worker are in flight and every block is dropped
+    once written, so memory does not grow with the number of files.
+    """
+    print(f"Processing JSON files in {step3_folder} in chunks of {chunk_size}")
     
-    json_files = [os.path.join(step3_folder, f) for f in os.listdir(step3_folder) if f.endswith('.json')]
+    if output_format == 'parquet':
+        writer = ParquetFeatureWriter(output_path)
+    else:
+        writer = CsvFeatureWriter(output_path)
     
-    print(f"Found {len(json_files)} JSON files to process")
+    written = 0
+    processed = 0
     
-    all_features = []
+    def collect(done, in_flight):
+        nonlocal written, processed
+        for future in done:
+            # Popping the future releases its block once it is written
+            chunk_length = in_flight.pop(future)
+            block = future.result()
+            writer.write_block(block)
+            written += len(block['ad_id'])
+            
+            processed += chunk_length
+            if processed // 100 > (processed - chunk_length) // 100:
+                print(f"Progress: {processed} files processed")
     
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {executor.submit(extract_car_features, f): f for f in json_files}
-        
-        processed = 0
-        for future in as_completed(future_to_file):
-            features = future.result()
-            if features:
-                all_features.append(features)
+    try:
+        # One task per chunk keeps pickling and scheduling overhead per file small
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            for chunk in iter_chunks(step3_folder, chunk_size):
+                in_flight[executor.submit(extract_features_block, chunk)] = len(chunk)
+                if len(in_flight) >= max_workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done, in_flight)
             
-            processed += 1
-            if processed % 100 == 0:
-                print(f"Progress: {processed}/{len(json_files)} files processed")
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done, in_flight)
+    finally:
+        writer.close()
     
-    # Write to CSV
-    if all_features:
-        fieldnames = ['ad_id', 'price', 'subject', 'brand', 'model', 'model_family', 'model_year', 
-                      'mileage', 'fuel', 'gearbox', 'horsepower', 'color', 'drive_wheels', 
-                      'body_type', 'first_traffic_date', 'equipment_count', 'advertiser_type', 
-                      'region', 'municipality']
-        
-        with open(output_csv, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(all_features)
-        
-        print(f"\nSuccessfully created {output_csv} with {len(all_features)} records")
+    if written:
+        print(f"\nSuccessfully created {output_path} with {written} records")
     else:
+        os.remove(output_path)
         print("No data extracted")
+    
+    return written
 
-def main():
+def main(output_format='csv', chunk_size=500):
     script_dir = os.path.dirname(os.path.abspath(__file__))
     step3_folder = os.path.join(script_dir, 'step3')
-    output_csv = os.path.join(script_dir, 'car_features_short.csv')
+    extension = 'parquet' if output_format == 'parquet' else 'csv'
+    output_path = os.path.join(script_dir, f'car_features_short.{extension}')
     
     if not os.path.exists(step3_folder):
         print(f"Error: {step3_folder} folder not found")
@@ -121,8 +220,11 @@ def main():
     max_workers = min(8, multiprocessing.cpu_count())
     print(f"Using {max_workers} processes")
     
-    process_json_files(step3_folder, output_csv, max_workers)
+    process_json_files(step3_folder, output_path, max_workers, output_format, chunk_size)
     print("\nProcessing complete!")
 
 if __name__ == "__main__":
-    main()
+    # Usage: python step4.py [csv|parquet] [chunk_size]
+    output_format = sys.argv[1] if len(sys.argv) > 1 else 'csv'
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    main(output_format, chunk_size)
@@ -46,7 +46,7 @@ pd.set_option("display.max_columns", 120)
 # In[3]:
 
 
-DATA_SOURCE = "local"
+DATA_SOURCE = "local"  # "local", "s3" or "parquet"
 
 # Set these if using S3
 S3_BUCKET = "blocket-lake--eun1-az1--x-s3"
@@ -56,6 +56,10 @@ if DATA_SOURCE == "s3":
     s3 = boto3.client("s3")
     obj = s3.get_object(Bucket=S3_BUCKET, Key=S3_KEY)
     df = pd.read_csv(io.BytesIO(obj["Body"].read()))
+elif DATA_SOURCE == "parquet":
+    # Typed output of `python step4.py parquet` in 3.3 (adjust as needed)
+    PARQUET_PATH = "car_features_short.parquet"
+    df = pd.read_parquet(PARQUET_PATH)
 else:
     # Local CSV path (adjust as needed)
     CSV_PATH = "cars.csv"
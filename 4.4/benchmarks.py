@@ -0,0 +1,231 @@
+import os
+import sys
+import io
+import csv
+import time
+import tempfile
+import tracemalloc
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+# Point lambda_function at a local MySQL or MariaDB, e.g.
+# docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=root -e MYSQL_DATABASE=cars mysql:8 --local-infile=1
+os.environ.setdefault('DB_HOST', '127.0.0.1')
+os.environ.setdefault('DB_PORT', '3306')
+os.environ.setdefault('DB_USER', 'root')
+os.environ.setdefault('DB_PASSWORD', 'root')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+def generate_cars_csv(path, rows=100000, first_id=1):
+    """Write a car_features_short.csv-shaped file with unique ad ids"""
+    from lambda_function import COLUMNS
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for n in range(rows):
+            writer.writerow([
+                first_id + n, 100000 + n % 400000, f"Volvo V60 D4 \"Momentum\", {n}", 'Volvo', 'V60',
+                'V60', 2000 + n % 25, n % 300000, 'Diesel', 'Automat', '190 Hk', 'Svart',
+                'Fyrhjulsdriven', 'Kombi', '2019-05-01', n % 40, 'private', 'Stockholm', 'Solna'
+            ])
+
+def reset_cars_table(connection):
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS cars")
+    with open(os.path.join(script_dir, 'create_cars_table.sql'), encoding='utf-8') as f:
+        cursor.execute(f.read())
+    connection.commit()
+    cursor.close()
+
+def server_version(connection):
+    """e.g. '8.0.36' or '10.11.6-MariaDB', printed with the results they belong to"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT VERSION()")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    return version
+
+def row_by_row(connection, rows):
+    """The previous loader: one execute per row and a single commit"""
+    from lambda_function import COLUMNS
+
+    insert_query = f"INSERT INTO cars ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+    cursor = connection.cursor()
+    row_count = 0
+    for row in rows:
+        cursor.execute(insert_query, row)
+        row_count += 1
+    connection.commit()
+    cursor.close()
+    return row_count
+
+def benchmark_ingest(rows=100000):
+    """Report rows per second of each ingest mode on one generated file"""
+    import lambda_function
+
+    path = os.path.join(tempfile.mkdtemp(), 'cars.csv')
+    generate_cars_csv(path, rows)
+
+    modes = [('row_by_row', row_by_row, 'executemany')]
+    modes += [(mode, ingester, mode) for mode, ingester in lambda_function.INGESTERS.items()]
+
+    results = []
+    for name, ingester, connect_mode in modes:
+        connection = lambda_function.connect(connect_mode)
+        version = server_version(connection)
+        reset_cars_table(connection)
+        start = time.time()
+        with open(path, newline='', encoding='utf-8') as f:
+            row_count = ingester(connection, lambda_function.read_rows(f))
+        elapsed = time.time() - start
+        connection.close()
+        assert row_count == rows
+        results.append((name, rows / elapsed))
+
+    print(f"\n{rows} rows, BATCH_SIZE={lambda_function.BATCH_SIZE}, server {version}")
+    for name, rate in results:
+        print(f"{name}: {rate:.0f} rows/s")
+
+def count_cars(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM cars")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+def benchmark_upsert(rows=100000):
+    """Ingest one file twice and an overlapping file once per mode, checking the table never gains duplicates"""
+    import lambda_function
+
+    workdir = tempfile.mkdtemp()
+    files = {}
+    # The second file repeats the last half of the first one's ads
+    for name, first_id in (('first', 1), ('overlap', rows // 2 + 1)):
+        files[name] = os.path.join(workdir, f"{name}.csv")
+        generate_cars_csv(files[name], rows, first_id)
+
+    results = []
+    for mode in lambda_function.INGESTERS:
+        connection = lambda_function.connect(mode)
+        version = server_version(connection)
+        reset_cars_table(connection)
+        for run, name, expected in (('load', 'first', rows), ('reload', 'first', rows),
+                                    ('overlap', 'overlap', rows + rows // 2)):
+            start = time.time()
+            with open(files[name], newline='', encoding='utf-8') as f:
+                lambda_function.ingest(connection, lambda_function.read_rows(f), mode, upsert=True)
+            elapsed = time.time() - start
+            count = count_cars(connection)
+            assert count == expected, (mode, run, count, expected)
+            results.append((mode, run, rows / elapsed, count))
+        connection.close()
+
+    print(f"\n{rows} rows per file, BATCH_SIZE={lambda_function.BATCH_SIZE}, server {version}")
+    for mode, run, rate, count in results:
+        print(f"{mode} upsert {run}: {rate:.0f} rows/s, {count} rows in cars")
+
+class GeneratedCsvBody(io.RawIOBase):
+    """Produces a cars CSV of `size` bytes on the fly, like an S3 body that is never held in memory"""
+
+    def __init__(self, size):
+        from lambda_function import COLUMNS
+
+        self.size = size
+        self.produced = 0
+        self.next_id = 1
+        self.pending = (','.join(COLUMNS) + '\n').encode('utf-8')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.pending) < len(buffer) and self.produced + len(self.pending) < self.size:
+            ad_id = self.next_id
+            self.next_id += 1
+            self.pending += (f'{ad_id},{100000 + ad_id % 400000},"Volvo V60 D4 ""Momentum"", {ad_id}",Volvo,V60,V60,'
+                             f'{2000 + ad_id % 25},{ad_id % 300000},Diesel,Automat,190 Hk,Svart,Fyrhjulsdriven,'
+                             f'Kombi,2019-05-01,{ad_id % 40},private,Stockholm,Solna\n').encode('utf-8')
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        self.produced += count
+        return count
+
+class StreamingS3Stub:
+    """S3 stand-in whose get_object returns a generated body of the requested size"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BufferedReader(GeneratedCsvBody(self.size), 1024 * 1024)}
+
+class CountingCursor:
+    rowcount = 0
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        pass
+
+    def executemany(self, query, batch):
+        self.connection.rows += len(batch)
+
+    def close(self):
+        pass
+
+class CountingConnection:
+    """MySQL stand-in that counts rows sent with executemany and discards everything"""
+
+    def __init__(self):
+        self.rows = 0
+        self.commits = 0
+
+    def cursor(self):
+        return CountingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+def benchmark_memory(sizes_mb=(64, 256, 1024)):
+    """Report peak traced memory of the handler on generated S3 bodies of growing size"""
+    import lambda_function
+
+    event = {'Records': [{'s3': {'bucket': {'name': 'stub'}, 'object': {'key': 'cars.csv'}}}]}
+
+    results = []
+    for size_mb in sizes_mb:
+        connection = CountingConnection()
+        lambda_function.s3 = StreamingS3Stub(size_mb * 1024 * 1024)
+        lambda_function.get_connection = lambda: connection
+
+        tracemalloc.start()
+        start = time.time()
+        response = lambda_function.lambda_handler(event, None)
+        elapsed = time.time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert response['statusCode'] == 200, response
+        results.append((size_mb, peak, connection.rows, connection.commits, elapsed))
+
+    print()
+    for size_mb, peak, rows, commits, elapsed in results:
+        print(f"{size_mb} MB input: peak {peak / (1024 * 1024):.1f} MB, {rows} rows in {commits} commits, {elapsed:.0f}s")
+
+benchmarks = {
+    'ingest': benchmark_ingest,
+    'upsert': benchmark_upsert,
+    'memory': benchmark_memory,
+}
+
+if __name__ == "__main__":
+    # Usage: python benchmarks.py <name>
+    name = sys.argv[1] if len(sys.argv) > 1 else 'ingest'
+    benchmarks[name]()
@@ -0,0 +1,28 @@
+CREATE TABLE IF NOT EXISTS cars (
+    ad_id BIGINT PRIMARY KEY,
+    price BIGINT,
+    subject VARCHAR(255),
+    brand VARCHAR(100),
+    model VARCHAR(100),
+    model_family VARCHAR(100),
+    model_year INT,
+    mileage VARCHAR(50),
+    fuel VARCHAR(50),
+    gearbox VARCHAR(50),
+    horsepower VARCHAR(50),
+    color VARCHAR(50),
+    drive_wheels VARCHAR(50),
+    body_type VARCHAR(50),
+    first_traffic_date VARCHAR(50),
+    equipment_count VARCHAR(20),
+    advertiser_type VARCHAR(50),
+    region VARCHAR(100),
+    municipality VARCHAR(100),
+    -- Equality filters of the read API, in ad_id order for keyset pages
+    INDEX idx_brand_model (brand, model, ad_id),
+    INDEX idx_brand (brand, ad_id),
+    INDEX idx_model (model, ad_id),
+    -- Range filters; rows in a range are not in ad_id order
+    INDEX idx_model_year (model_year),
+    INDEX idx_price (price)
+);
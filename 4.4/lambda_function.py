@@ -1,68 +1,243 @@
+import io
+import os
+import csv
 import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
 import boto3
 import mysql.connector
-import csv
-from io import StringIO
+from mysql.connector import pooling
 
-def lambda_handler(event, context):
+# Columns of car_features_short.csv, in table order
+COLUMNS = ['ad_id', 'price', 'subject', 'brand', 'model', 'model_family', 'model_year', 'mileage',
+           'fuel', 'gearbox', 'horsepower', 'color', 'drive_wheels', 'body_type',
+           'first_traffic_date', 'equipment_count', 'advertiser_type', 'region', 'municipality']
+
+# Numeric columns of the cars table; empty CSV values are loaded as NULL
+NUMERIC_COLUMNS = {'price', 'model_year'}
+
+# 'executemany' sends multi-row INSERT batches, 'load_data' uses LOAD DATA LOCAL INFILE
+INGEST_MODE = os.environ.get('INGEST_MODE', 'executemany')
+
+# Rows per batch; every batch is committed on its own
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '5000'))
+
+# Load into a staging table and merge into cars by ad_id, so a file can be ingested again safely
+UPSERT = os.environ.get('UPSERT', 'true').lower() == 'true'
+
+# Objects ingested at the same time; each worker holds one pooled connection
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '4'))
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'database-1.c1ueeskysdez.eu-north-1.rds.amazonaws.com'),
+    'user': os.environ.get('DB_USER', 'admin'),
+    'password': os.environ.get('DB_PASSWORD', 'haydegidelum'),
+    'port': int(os.environ.get('DB_PORT', '63306')),
+    'database': os.environ.get('DB_NAME', 'cars')
+}
+
+# Reused across warm invocations
+s3 = boto3.client('s3')
+connection_pool = None
+pool_lock = threading.Lock()
+
+def connect(mode=INGEST_MODE):
+    """Open a MySQL connection, allowing LOCAL INFILE only for the load_data mode"""
+    return mysql.connector.connect(allow_local_infile=(mode == 'load_data'), **DB_CONFIG)
+
+def get_connection():
+    """
+    Borrow a connection from the pool, which is created on first use and kept
+    for warm invocations. Closing the connection returns it to the pool.
+    """
+    global connection_pool
+    with pool_lock:
+        if connection_pool is None:
+            connection_pool = pooling.MySQLConnectionPool(
+                pool_name='cars_loader',
+                pool_size=MAX_WORKERS,
+                allow_local_infile=(INGEST_MODE == 'load_data'),
+                **DB_CONFIG
+            )
+    return connection_pool.get_connection()
+
+def read_rows(csv_file):
+    """Yield one tuple per row of a text CSV stream, ordered like COLUMNS"""
+    for row in csv.DictReader(csv_file):
+        yield tuple(None if column in NUMERIC_COLUMNS and row[column] == '' else row[column]
+                    for column in COLUMNS)
+
+def open_csv_stream(body):
+    """
+    Decode an S3 body as it is read, so only the current buffer and the
+    batch being inserted are in memory, never the whole file
+    """
+    return io.TextIOWrapper(body, encoding='utf-8', newline='')
+
+def batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insert_batches(connection, rows, batch_size=BATCH_SIZE, table='cars'):
+    """
+    Insert rows with executemany, which the connector sends as one multi-row
+    INSERT per batch, and commit after every batch. Returns the row count.
+    """
+    insert_query = f"""
+    INSERT INTO {table} ({', '.join(COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(COLUMNS))})
+    """
+
+    row_count = 0
+    cursor = connection.cursor()
     try:
-        print("Lambda function started")
-        s3 = boto3.client('s3')
-        
-        bucket = event['Records'][0]['s3']['bucket']['name']
-        key = event['Records'][0]['s3']['object']['key']
-        print(f"Bucket: {bucket}, Key: {key}")
-        
-        # Get CSV from S3
-        response = s3.get_object(Bucket=bucket, Key=key)
-        csv_content = response['Body'].read().decode('utf-8')
-        print("CSV file downloaded from S3")
-        
-        # Parse CSV
-        csv_reader = csv.DictReader(StringIO(csv_content))
-        
-        # Connect to RDS
-        print("Connecting to RDS...")
-        connection = mysql.connector.connect(
-            host='database-1.c1ueeskysdez.eu-north-1.rds.amazonaws.com',
-            user='admin',
-            password='haydegidelum',
-            port=63306,
-            database='cars'
-        )
-        print("Connected to RDS")
-        
-        cursor = connection.cursor()
-        
-        # Insert data
-        insert_query = """
-        INSERT INTO cars (ad_id, price, subject, brand, model, model_family, model_year, mileage, 
-                          fuel, gearbox, horsepower, color, drive_wheels, body_type, 
-                          first_traffic_date, equipment_count, advertiser_type, region, municipality)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        row_count = 0
-        for row in csv_reader:
-            cursor.execute(insert_query, (
-                row['ad_id'], row['price'], row['subject'], row['brand'], row['model'],
-                row['model_family'], row['model_year'], row['mileage'], row['fuel'],
-                row['gearbox'], row['horsepower'], row['color'], row['drive_wheels'],
-                row['body_type'], row['first_traffic_date'], row['equipment_count'],
-                row['advertiser_type'], row['region'], row['municipality']
-            ))
-            row_count += 1
-        
+        for batch in batches(rows, batch_size):
+            cursor.executemany(insert_query, batch)
+            connection.commit()
+            row_count += len(batch)
+            print(f"Committed {row_count} rows")
+    finally:
+        cursor.close()
+    return row_count
+
+def load_data_batches(connection, rows, batch_size=BATCH_SIZE, table='cars'):
+    """
+    Write each batch to a temporary CSV file in /tmp and load it with
+    LOAD DATA LOCAL INFILE, committing after every batch. Returns the row count.
+    """
+    row_count = 0
+    cursor = connection.cursor()
+    try:
+        for batch in batches(rows, batch_size):
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8') as chunk_file:
+                # An unquoted NULL is read as NULL when ESCAPED BY is empty
+                csv.writer(chunk_file, lineterminator='\n').writerows(
+                    ['NULL' if value is None else value for value in row] for row in batch
+                )
+                chunk_file.flush()
+
+                cursor.execute(f"""
+                LOAD DATA LOCAL INFILE '{chunk_file.name}'
+                INTO TABLE {table}
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+                LINES TERMINATED BY '\\n'
+                ({', '.join(COLUMNS)})
+                """)
+            connection.commit()
+            row_count += len(batch)
+            print(f"Committed {row_count} rows")
+    finally:
+        cursor.close()
+    return row_count
+
+INGESTERS = {
+    'executemany': insert_batches,
+    'load_data': load_data_batches
+}
+
+def upsert_via_staging(connection, rows, ingester=insert_batches, batch_size=BATCH_SIZE):
+    """
+    Bulk-load rows into a temporary staging table with `ingester`, then merge
+    them into cars with one INSERT ... SELECT ... ON DUPLICATE KEY UPDATE.
+
+    Needs ad_id as the primary key of cars. Returns the number of rows loaded.
+    """
+    cursor = connection.cursor()
+    try:
+        # Session-scoped, so parallel loaders never see each other's rows.
+        # CREATE ... SELECT copies the column types but no key or index: the
+        # load does not maintain the read indexes of cars, and duplicate ads
+        # within one file do not abort it.
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS cars_staging")
+        cursor.execute(f"CREATE TEMPORARY TABLE cars_staging SELECT {', '.join(COLUMNS)} FROM cars LIMIT 0")
+
+        row_count = ingester(connection, rows, batch_size, table='cars_staging')
+
+        updates = ', '.join(f"{column} = cars_staging.{column}" for column in COLUMNS if column != 'ad_id')
+        cursor.execute(f"""
+        INSERT INTO cars ({', '.join(COLUMNS)})
+        SELECT {', '.join(COLUMNS)} FROM cars_staging
+        ON DUPLICATE KEY UPDATE {updates}
+        """)
+        # 1 per inserted row, 2 per updated row, 0 per unchanged row
+        print(f"Merged {row_count} staged rows into cars ({cursor.rowcount} affected)")
         connection.commit()
-        print(f"Inserted {row_count} rows")
-        
+
+        cursor.execute("DROP TEMPORARY TABLE cars_staging")
+    finally:
         cursor.close()
-        connection.close()
-        print("Connection closed")
-        
+    return row_count
+
+def ingest(connection, rows, mode=INGEST_MODE, upsert=UPSERT):
+    """Load rows with the given mode, directly into cars or through the staging upsert"""
+    if upsert:
+        return upsert_via_staging(connection, rows, INGESTERS[mode])
+    return INGESTERS[mode](connection, rows)
+
+def ingest_object(bucket, key):
+    """Stream one S3 object into cars over a pooled connection and return its result"""
+    start = time.time()
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        try:
+            connection = get_connection()
+            try:
+                row_count = ingest(connection, read_rows(open_csv_stream(response['Body'])))
+            finally:
+                connection.close()
+        finally:
+            response['Body'].close()
+
+        elapsed = time.time() - start
+        print(f"Inserted {row_count} rows from s3://{bucket}/{key} with {INGEST_MODE}{' upsert' if UPSERT else ''} "
+              f"in {elapsed:.2f}s ({row_count / elapsed if elapsed else 0:.0f} rows/s)")
+        return {'bucket': bucket, 'key': key, 'success': True, 'rows': row_count, 'seconds': round(elapsed, 2)}
+
+    except Exception as e:
+        print(f"Error ingesting s3://{bucket}/{key}: {str(e)}")
+        return {'bucket': bucket, 'key': key, 'success': False, 'error': str(e)}
+
+def lambda_handler(event, context):
+    """Ingest every object of an S3 event notification, MAX_WORKERS objects at a time"""
+    try:
+        print("Lambda function started")
+
+        # Keys arrive URL-encoded in S3 events, e.g. data/train+%281%29.csv
+        objects = [(record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key']))
+                   for record in event['Records']]
+        print(f"Ingesting {len(objects)} objects")
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(lambda obj: ingest_object(*obj), objects))
+
+        failed = sum(1 for result in results if not result['success'])
+        row_count = sum(result.get('rows', 0) for result in results)
+
+        if failed == 0:
+            status_code = 200
+        elif failed < len(results):
+            status_code = 207  # Multi-Status
+        else:
+            status_code = 500
+
         return {
-            'statusCode': 200,
-            'body': json.dumps(f'Data inserted successfully: {row_count} rows')
+            'statusCode': status_code,
+            'body': json.dumps({
+                'message': f'Inserted {row_count} rows from {len(results) - failed} of {len(results)} objects',
+                'rows': row_count,
+                'failed_objects': failed,
+                'results': results
+            })
         }
     except Exception as e:
         print(f"Error: {str(e)}")
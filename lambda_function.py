@@ -1,39 +1,133 @@
+import os
 import json
 import mysql.connector
 
+# Columns of the cars table, see 4.4/create_cars_table.sql
+COLUMNS = ['ad_id', 'price', 'subject', 'brand', 'model', 'model_family', 'model_year', 'mileage',
+           'fuel', 'gearbox', 'horsepower', 'color', 'drive_wheels', 'body_type',
+           'first_traffic_date', 'equipment_count', 'advertiser_type', 'region', 'municipality']
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Query parameter -> indexed predicate, see build_query for which ones keep pages cheap
+FILTERS = {
+    'brand': ('brand = %s', str),
+    'model': ('model = %s', str),
+    'year_min': ('model_year >= %s', int),
+    'year_max': ('model_year <= %s', int),
+    'price_min': ('price >= %s', int),
+    'price_max': ('price <= %s', int),
+}
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'database-1.c1ueeskysdez.eu-north-1.rds.amazonaws.com'),
+    'user': os.environ.get('DB_USER', 'admin'),
+    'password': os.environ.get('DB_PASSWORD', 'haydegidelum'),
+    'port': int(os.environ.get('DB_PORT', '63306')),
+    'database': os.environ.get('DB_NAME', 'cars')
+}
+
+# Reused across warm invocations
+connection = None
+
+def get_connection():
+    """Return the cached connection, reconnecting when it was dropped"""
+    global connection
+    if connection is None or not connection.is_connected():
+        # Autocommit so every page reads the latest data, not the first page's snapshot
+        connection = mysql.connector.connect(autocommit=True, **DB_CONFIG)
+    return connection
+
+def build_query(params):
+    """
+    Turn query string parameters into (sql, args, limit).
+
+    Pages are ordered by ad_id and start after the `after` cursor. With no
+    filter, or brand and/or model equality, that is an index range read of
+    one page however deep it is (idx_brand_model, idx_brand, idx_model).
+    Year and price ranges are not in ad_id order: MySQL either walks ad_id
+    and skips rows outside the range, or sorts every row in the range, so
+    those pages get slower as the table grows. Raises ValueError on invalid
+    parameters.
+    """
+    limit = int(params.get('limit') or DEFAULT_LIMIT)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    # ad_id is always returned because it is the cursor
+    columns = ['ad_id']
+    if params.get('fields'):
+        for field in params['fields'].split(','):
+            field = field.strip()
+            if field not in COLUMNS:
+                raise ValueError(f"Unknown field: {field}")
+            if field not in columns:
+                columns.append(field)
+    else:
+        columns = COLUMNS
+
+    conditions = []
+    args = []
+    if params.get('after'):
+        conditions.append('ad_id > %s')
+        args.append(int(params['after']))
+    for name, (predicate, convert) in FILTERS.items():
+        if params.get(name):
+            conditions.append(predicate)
+            args.append(convert(params[name]))
+
+    sql = f"SELECT {', '.join(columns)} FROM cars"
+    if conditions:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    # One extra row tells whether there is a next page
+    sql += " ORDER BY ad_id LIMIT %s"
+    args.append(limit + 1)
+    return sql, args, limit
+
 def lambda_handler(event, context):
     """
-    Lambda function that fetches all data from RDS MySQL database.
+    Lambda function that returns one page of cars from RDS MySQL database.
+
+    Query parameters: limit, after (ad_id cursor), fields (comma separated),
+    brand, model, year_min, year_max, price_min, price_max. Pass the returned
+    `next` as `after` to read the following page; it is null on the last page.
     """
-    
-    connection = None
+    params = (event or {}).get('queryStringParameters') or {}
+
+    try:
+        sql, args, limit = build_query(params)
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": str(e)})
+        }
+
     try:
-        connection = mysql.connector.connect(
-            host='database-1.c1ueeskysdez.eu-north-1.rds.amazonaws.com',
-            user='admin',
-            password='haydegidelum',
-            port=63306,
-            database='cars'
-        )
-        
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM cars")
+        cursor = get_connection().cursor(dictionary=True)
+        cursor.execute(sql, args)
         results = cursor.fetchall()
         cursor.close()
-        
+
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = str(results[-1]['ad_id'])
+
         return {
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(results, default=str)
+            "body": json.dumps({
+                "items": results,
+                "count": len(results),
+                "next": next_cursor
+            }, default=str)
         }
-    
+
     except Exception as e:
         return {
             "statusCode": 500,
             "headers": {"Content-Type": "application/json"},
             "body": json.dumps({"error": str(e)})
         }
-    
-    finally:
-        if connection:
-            connection.close()